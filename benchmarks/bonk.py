@@ -0,0 +1,212 @@
+"""
+Offline benchmark of the bonk rendering pipeline.
+
+Synthetic avatars of different formats, modes and sizes are fed to `Bonk._generate_gif`
+without Discord or network access, in each output mode. Every case runs in a fresh process
+so its peak RSS is not polluted by the previous ones.
+
+    python -m benchmarks.bonk --runs 20 --output bonk.json
+    python -m benchmarks.bonk --baseline bonk.json
+"""
+import argparse
+import json
+import multiprocessing
+import platform
+import resource
+import statistics
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from time import perf_counter
+from typing import Callable, Dict, Optional
+
+import PIL
+from PIL import Image, ImageDraw
+
+
+def _gradient(mode: str, size: int) -> Image.Image:
+    """Create a busy test avatar, so the encoder can't take shortcuts on flat colours."""
+    image = Image.radial_gradient("L").resize((size, size)).convert("RGB")
+    draw = ImageDraw.Draw(image)
+    for i in range(0, size // 2, max(size // 32, 1)):
+        draw.rectangle(
+            (i, i, size - 1 - i, size - 1 - i), outline=(i % 256, 80, 255 - i % 256)
+        )
+    if mode == "RGBA":
+        image.putalpha(Image.linear_gradient("L").resize((size, size)))
+    elif mode == "P":
+        image = image.quantize(64)
+    else:
+        image = image.convert(mode)
+    return image
+
+
+def _encode(image: Image.Image, format_: str, **params) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, format_, **params)
+    return buffer.getvalue()
+
+
+def _animated_gif() -> bytes:
+    frames = [_gradient("RGB", 256).rotate(angle) for angle in range(0, 360, 30)]
+    return _encode(
+        frames[0], "GIF", save_all=True, append_images=frames[1:], duration=40
+    )
+
+
+CASES: Dict[str, Callable[[], bytes]] = {
+    "png-rgba-512": lambda: _encode(_gradient("RGBA", 512), "PNG"),
+    "png-p-512": lambda: _encode(_gradient("P", 512), "PNG"),
+    "png-l-512": lambda: _encode(_gradient("L", 512), "PNG"),
+    "jpeg-rgb-512": lambda: _encode(_gradient("RGB", 512), "JPEG", quality=90),
+    "gif-animated-256": _animated_gif,
+    "png-rgba-4096": lambda: _encode(_gradient("RGBA", 4096), "PNG"),
+}
+
+# Render options of each output mode, compared against the default "gif" mode
+MODES: Dict[str, dict] = {
+    "gif": {},
+    "lite": {"lite": True},
+    "webp": {"format": "webp"},
+    "lite-webp": {"lite": True, "format": "webp"},
+}
+
+
+def _disable_logs() -> None:
+    """Silence the bot's logs, which the rendering stages write on every call."""
+    from loguru import logger
+
+    logger.disable("bot")
+
+
+def run_case(name: str, runs: int, options: dict) -> dict:
+    """Render the avatar of case `name` `runs` times and return its measurements."""
+    from bot.exts.fun.bonker import Bonk, RenderOptions
+
+    render_options = RenderOptions()._replace(**options)
+    avatar = CASES[name]()
+    # Warm up, so one-off template work isn't measured
+    Bonk._generate_gif(avatar, render_options)
+
+    timings = []
+    for _ in range(runs):
+        start = perf_counter()
+        out_gif = Bonk._generate_gif(avatar, render_options)
+        timings.append(perf_counter() - start)
+
+    percentiles = statistics.quantiles(timings, n=100, method="inclusive")
+    return {
+        "runs": runs,
+        "avatar_bytes": len(avatar),
+        "mean_s": statistics.fmean(timings),
+        "p50_s": percentiles[49],
+        "p90_s": percentiles[89],
+        "p99_s": percentiles[98],
+        # ru_maxrss is reported in KiB on Linux
+        "peak_rss_mib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "output_bytes": len(out_gif),
+    }
+
+
+def _print_ratios(label: str, case: dict, old: dict) -> None:
+    print(
+        f"{label:<28} {case['p50_s'] / old['p50_s']:>7.2f}x "
+        f"{case['p90_s'] / old['p90_s']:>7.2f}x "
+        f"{case['p99_s'] / old['p99_s']:>7.2f}x "
+        f"{case['peak_rss_mib'] / old['peak_rss_mib']:>7.2f}x "
+        f"{case['output_bytes'] / old['output_bytes']:>7.2f}x"
+    )
+
+
+def _print_results(results: dict, baseline: Optional[dict]) -> None:
+    header = (
+        f"{'case':<28} {'p50':>8} {'p90':>8} {'p99':>8} {'rss MiB':>8} {'out KiB':>8}"
+    )
+    print(header)
+    print("-" * len(header))
+    for name, case in results["cases"].items():
+        print(
+            f"{name:<28} {case['p50_s']:>7.3f}s {case['p90_s']:>7.3f}s "
+            f"{case['p99_s']:>7.3f}s {case['peak_rss_mib']:>8.1f} "
+            f"{case['output_bytes'] / 1024:>8.0f}"
+        )
+        avatar, mode = name.split("/")
+        if mode != "gif" and f"{avatar}/gif" in results["cases"]:
+            _print_ratios("  vs gif", case, results["cases"][f"{avatar}/gif"])
+        if baseline and name in baseline["cases"]:
+            _print_ratios("  vs baseline", case, baseline["cases"][name])
+
+
+def main() -> None:
+    """Run the selected benchmark cases and report or save their results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=10, help="renders per case")
+    parser.add_argument(
+        "--case", action="append", choices=CASES, help="case to run, repeatable"
+    )
+    parser.add_argument(
+        "--mode", action="append", choices=MODES, help="output mode, repeatable"
+    )
+    parser.add_argument("--output", type=Path, help="write results to this JSON file")
+    parser.add_argument("--baseline", type=Path, help="JSON results to compare with")
+    parser.add_argument(
+        "--palette", choices=("adaptive", "global"), help="palette of the gif frames"
+    )
+    parser.add_argument(
+        "--avatar-colours", type=int, help="global palette entries for the avatar"
+    )
+    parser.add_argument(
+        "--dither", action=argparse.BooleanOptionalAction, help="dither to the palette"
+    )
+    parser.add_argument(
+        "--diff-threshold",
+        type=int,
+        help="frame differencing threshold, negative to disable",
+    )
+    args = parser.parse_args()
+
+    if args.runs < 2:
+        parser.error("--runs must be at least 2 to compute percentiles.")
+
+    # Options left out fall back to the defaults from the environment
+    options = {
+        name: value
+        for name, value in (
+            ("palette", args.palette),
+            ("avatar_colours", args.avatar_colours),
+            ("dither", args.dither),
+            ("diff_threshold", args.diff_threshold),
+        )
+        if value is not None
+    }
+    if options.get("diff_threshold", 0) < 0:
+        options["diff_threshold"] = None
+
+    results = {
+        "python": platform.python_version(),
+        "pillow": PIL.__version__,
+        "machine": platform.machine(),
+        "options": options,
+        "cases": {},
+    }
+    _disable_logs()
+    context = multiprocessing.get_context("spawn")
+    for name in args.case or CASES:
+        for mode in args.mode or MODES:
+            with ProcessPoolExecutor(
+                1, mp_context=context, initializer=_disable_logs
+            ) as pool:
+                results["cases"][f"{name}/{mode}"] = pool.submit(
+                    run_case, name, args.runs, {**options, **MODES[mode]}
+                ).result()
+
+    baseline = json.loads(args.baseline.read_text()) if args.baseline else None
+    _print_results(results, baseline)
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,243 @@
+"""
+Offline benchmark of the CPU-bound stages of the eval command.
+
+Messages and tio.run results of different shapes are run through each stage the command
+goes through, from parsing the message to formatting the embed, without Discord or
+network access. Stages are timed separately, then run once more under tracemalloc to
+report the memory they allocate.
+
+    python -m benchmarks.eval --runs 50 --output eval.json
+    python -m benchmarks.eval --level 6 --baseline eval.json
+"""
+import argparse
+import json
+import platform
+import statistics
+import tracemalloc
+import zlib
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Callable, Coroutine, Dict, NamedTuple, Optional
+
+
+class Case(NamedTuple):
+    """An eval command message, and the tio.run result of running it."""
+
+    message: str
+    result: str
+    # Attached code is used as is, instead of the code in the message
+    attachment: str = ""
+
+
+def _result(output: str, exit_code: int = 0, truncated: bool = False) -> str:
+    from bot.exts.utils._eval_helper import TRUNCATED_ERROR
+
+    return (
+        f"{output}\n"
+        "Real time: 0.042 s\n"
+        "User time: 0.031 s\n"
+        "Sys. time: 0.008 s\n"
+        "CPU share: 92.86 %\n"
+        f"Exit code: {exit_code}" + (TRUNCATED_ERROR if truncated else "")
+    )
+
+
+def _attachment(size: int) -> str:
+    """Create a program of about `size` bytes."""
+    functions = []
+    i = 0
+    while sum(map(len, functions)) < size:
+        functions.append(f"def function_{i}(value):\n    return value * {i} + {i}\n\n")
+        i += 1
+    return "".join(functions)
+
+
+CASES: Dict[str, Callable[[], Case]] = {
+    "small": lambda: Case(
+        "python\n```py\nprint('Hello, world!')\n```", _result("Hello, world!")
+    ),
+    "attachment-20k": lambda: Case(
+        "python --stats", _result("42"), attachment=_attachment(20_000)
+    ),
+    "options": lambda: Case(
+        "python --stats --no-cache\n"
+        "```py\nimport sys\nprint(sys.argv, input())\n```\n"
+        "input 42\ncommand-line-options -O -u\narguments first second third",
+        _result("['main.py', 'first', 'second', 'third'] 42"),
+    ),
+    "output-10k-lines": lambda: Case(
+        "python\n```py\nfor i in range(10_000): print(i)\n```",
+        _result("\n".join(map(str, range(10_000)))),
+    ),
+    "long-line-128k": lambda: Case(
+        "python\n```py\nprint('x' * 131_072, end='')\n```",
+        _result("x" * 131_072, truncated=True),
+    ),
+    "long-code-line": lambda: Case(
+        "python\n```py\nprint(" + " + ".join(["1"] * 20_000) + ")\n```",
+        _result("20000"),
+    ),
+    "backticks": lambda: Case(
+        "python\n```py\nprint('```' * 1000)\n```", _result("```" * 1000, exit_code=1)
+    ),
+}
+
+
+def _run_sync(coroutine: Coroutine) -> Any:
+    """Run a coroutine that never awaits, without the overhead of an event loop."""
+    try:
+        coroutine.send(None)
+    except StopIteration as e:
+        return e.value
+    raise RuntimeError("The coroutine awaited something.")
+
+
+def _stages(case: Case, level: int) -> Dict[str, Callable[[], object]]:
+    """Return the stages of the eval command, each running on the previous one's output."""
+    from bot.exts.utils._eval_helper import (
+        EvalHelper,
+        EvalOutput,
+        FormatOutput,
+        _to_tio_string,
+    )
+
+    language, code = case.message.split(maxsplit=1)
+    helper = EvalHelper(language, None)
+    inputs, parsed_code, lang, options, flags, cl_options, args = _run_sync(
+        helper.parse(code)
+    )
+
+    strings = {
+        "lang": [lang],
+        ".code.tio": case.attachment or parsed_code,
+        ".input.tio": inputs,
+        "TIO_CFLAGS": flags,
+        "TIO_OPTIONS": cl_options,
+        "args": args,
+    }
+    request = b"".join(map(_to_tio_string, strings.items())) + b"R"
+    output = EvalOutput.parse(case.result, stats=options["--stats"])
+    format_output = FormatOutput(language=lang)
+    excerpt, cut = format_output.excerpt(output)
+
+    def format_() -> object:
+        if cut:
+            return format_output.format_hastebin_output(output, excerpt, None)
+        return format_output.format_code_output(output, excerpt)
+
+    return {
+        "parse": lambda: _run_sync(helper.parse(code)),
+        "tio_string": lambda: b"".join(map(_to_tio_string, strings.items())),
+        "compress": lambda: zlib.compress(request, level)[2:-4],
+        "output_parse": lambda: EvalOutput.parse(case.result, stats=options["--stats"]),
+        "excerpt": lambda: format_output.excerpt(output),
+        "format": format_,
+    }
+
+
+def run_case(name: str, runs: int, level: int) -> dict:
+    """Run every stage of case `name` `runs` times and return its measurements."""
+    case = CASES[name]()
+    stages = _stages(case, level)
+    results = {
+        "message_bytes": len((case.message + case.attachment).encode("utf-8")),
+        "result_bytes": len(case.result.encode("utf-8")),
+        "stages": {},
+    }
+    for stage, func in stages.items():
+        func()  # Warm up
+        timings = []
+        for _ in range(runs):
+            start = perf_counter()
+            func()
+            timings.append(perf_counter() - start)
+
+        tracemalloc.start()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        percentiles = statistics.quantiles(timings, n=100, method="inclusive")
+        results["stages"][stage] = {
+            "mean_s": statistics.fmean(timings),
+            "p50_s": percentiles[49],
+            "p99_s": percentiles[98],
+            "peak_alloc_kib": peak / 1024,
+        }
+
+    results["request_bytes"] = len(stages["compress"]())
+    return results
+
+
+def _print_results(results: dict, baseline: Optional[dict]) -> None:
+    header = f"{'case / stage':<28} {'p50 ms':>9} {'p99 ms':>9} {'peak KiB':>9}"
+    print(header)
+    print("-" * len(header))
+    for name, case in results["cases"].items():
+        print(
+            f"{name} ({case['message_bytes'] / 1024:.1f} KiB message, "
+            f"{case['result_bytes'] / 1024:.1f} KiB result, "
+            f"{case['request_bytes'] / 1024:.1f} KiB request)"
+        )
+        old_case = baseline["cases"].get(name) if baseline else None
+        for stage, timings in case["stages"].items():
+            line = (
+                f"  {stage:<26} {timings['p50_s'] * 1000:>9.3f} "
+                f"{timings['p99_s'] * 1000:>9.3f} {timings['peak_alloc_kib']:>9.1f}"
+            )
+            if old_case and stage in old_case["stages"]:
+                old = old_case["stages"][stage]
+                line += (
+                    f"  {timings['p50_s'] / old['p50_s']:>6.2f}x p50 vs baseline, "
+                    f"{timings['peak_alloc_kib'] / max(old['peak_alloc_kib'], 0.001):.2f}x"
+                    " peak"
+                )
+            print(line)
+
+
+def main() -> None:
+    """Run the selected benchmark cases and report or save their results."""
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=20, help="runs of each stage")
+    parser.add_argument(
+        "--case", action="append", choices=CASES, help="case to run, repeatable"
+    )
+    parser.add_argument(
+        "--level",
+        type=int,
+        default=9,
+        choices=range(10),
+        metavar="0-9",
+        help="zlib level of the tio.run request",
+    )
+    parser.add_argument("--output", type=Path, help="write results to this JSON file")
+    parser.add_argument("--baseline", type=Path, help="JSON results to compare with")
+    args = parser.parse_args()
+
+    if args.runs < 2:
+        parser.error("--runs must be at least 2 to compute percentiles.")
+
+    from loguru import logger
+
+    # The formatting stages log every call
+    logger.disable("bot")
+
+    results = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "level": args.level,
+        "cases": {
+            name: run_case(name, args.runs, args.level) for name in args.case or CASES
+        },
+    }
+
+    baseline = json.loads(args.baseline.read_text()) if args.baseline else None
+    _print_results(results, baseline)
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import multiprocessing
 import os
 import typing
 
@@ -22,6 +23,10 @@ def should_rotate(message: loguru.Message, file: typing.TextIO) -> bool:
     return False
 
 
-if ENVIRONMENT != "production":
-    logger.add(LOG_FILE, rotation=should_rotate)
-logger.info("Logging Process Started")
+# Spawned render workers import the package too, but only the bot process owns the log
+# file, as several processes rotating it would clobber each other's logs. Children are
+# named before they import anything, unlike their parent process which is set later.
+if multiprocessing.current_process().name == "MainProcess":
+    if ENVIRONMENT != "production":
+        logger.add(LOG_FILE, rotation=should_rotate)
+    logger.info("Logging Process Started")
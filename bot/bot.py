@@ -9,6 +9,11 @@ from disnake.ext import commands
 from loguru import logger
 
 from bot.postgres import create_tables
+from bot.utils.avatars import AvatarService
+from bot.utils.http import ConnectionStats, pooled_session
+from bot.utils.loop_monitor import LoopMonitor
+from bot.utils.render import RenderService
+from bot.utils.scheduler import FairScheduler
 
 from . import constants
 
@@ -23,6 +28,26 @@ class Bot(commands.Bot):
 
         self.http_session = ClientSession()
         self.db_pool: asyncpg.Pool = asyncpg.create_pool(constants.DATABASE_URL)
+        self.render_service = RenderService(
+            constants.Images.render_workers, constants.Images.render_queue_size
+        )
+        self.avatar_service = AvatarService(
+            constants.Images.avatar_cache_max_bytes, constants.Images.avatar_cache_ttl
+        )
+        # Evals hit the same few hosts all the time, so their connections are kept alive
+        self.eval_http_stats = ConnectionStats()
+        self.eval_session = pooled_session(
+            self.eval_http_stats,
+            constants.Evals.http_limit_per_host,
+            constants.Evals.http_timeout,
+            constants.Evals.http_connect_timeout,
+            constants.Evals.http_dns_ttl,
+        )
+        self.eval_scheduler = FairScheduler(
+            constants.Evals.max_running,
+            constants.Evals.max_queue,
+            constants.Evals.max_queue_per_user,
+        )
         allowed_mention_roles = [
             Object(r)
             for r in [
@@ -49,6 +74,15 @@ class Bot(commands.Bot):
             ),
         )
 
+        # Installed first, so that the tasks of the bot are stamped with their age
+        self.loop_monitor = LoopMonitor(
+            constants.LoopMonitoring.lag_interval,
+            constants.LoopMonitoring.lag_samples,
+            constants.LoopMonitoring.slow_step_seconds,
+            constants.LoopMonitoring.slow_steps_kept,
+        )
+        self.loop_monitor.install(self.loop)
+
         self.loop.create_task(self._db_setup())
 
         self.launch_time = datetime.utcnow().timestamp()
@@ -120,9 +154,15 @@ class Bot(commands.Bot):
 
     async def close(self) -> None:
         """Close Http session when bot is shutting down."""
+        self.render_service.shutdown()
+        self.loop_monitor.uninstall()
+
         if self.http_session:
             await self.http_session.close()
 
+        if self.eval_session:
+            await self.eval_session.close()
+
         if self.db_pool:
             await self.db_pool.close()
 
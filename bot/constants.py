@@ -87,6 +87,104 @@ class Roles(NamedTuple):
     events = int(os.getenv("EVENTS_ID", 890656665328820224))
 
 
+class Images(NamedTuple):
+    # Process pool shared by the image commands, and how many jobs may wait for it
+    render_workers = int(os.getenv("RENDER_WORKERS", 2))
+    render_queue_size = int(os.getenv("RENDER_QUEUE_SIZE", 10))
+
+    # Downloaded avatars shared by the image commands
+    avatar_cache_max_bytes = int(os.getenv("AVATAR_CACHE_MAX_BYTES", 16 * 2 ** 20))
+    avatar_cache_ttl = int(os.getenv("AVATAR_CACHE_TTL", 10 * 60))
+
+    # Rendered `!color` swatches
+    color_cache_max_bytes = int(os.getenv("COLOR_CACHE_MAX_BYTES", 2 ** 20))
+
+    # Bonk gif encoding, see bonker.RenderOptions
+    bonk_palette = os.getenv("BONK_PALETTE", "global")
+    bonk_avatar_colours = int(os.getenv("BONK_AVATAR_COLOURS", 32))
+    bonk_dither = os.getenv("BONK_DITHER", "false").lower() == "true"
+    # Frame differencing is disabled when the threshold is negative
+    bonk_diff_threshold = int(os.getenv("BONK_DIFF_THRESHOLD", 8))
+    bonk_diff_threshold = bonk_diff_threshold if bonk_diff_threshold >= 0 else None
+
+    # Bonks are rendered in lite mode once this many are waiting in the render queue
+    bonk_lite_queue_depth = int(os.getenv("BONK_LITE_QUEUE_DEPTH", 3))
+
+    # Load the bonk template in the render workers once ready, instead of on the first bonk
+    bonk_prewarm = os.getenv("BONK_PREWARM", "true").lower() == "true"
+
+    # Rendered bonk gifs kept in memory, and optionally on disk when a directory is given
+    bonk_cache_max_bytes = int(os.getenv("BONK_CACHE_MAX_BYTES", 64 * 2 ** 20))
+    bonk_cache_dir = os.getenv("BONK_CACHE_DIR")
+    bonk_disk_cache_max_bytes = int(
+        os.getenv("BONK_DISK_CACHE_MAX_BYTES", 512 * 2 ** 20)
+    )
+
+
+class Evals(NamedTuple):
+    # Pooled keep-alive HTTP session to the eval and paste services
+    http_limit_per_host = int(os.getenv("EVAL_HTTP_LIMIT_PER_HOST", 8))
+    http_timeout = int(os.getenv("EVAL_HTTP_TIMEOUT", 60))
+    http_connect_timeout = int(os.getenv("EVAL_HTTP_CONNECT_TIMEOUT", 10))
+    http_dns_ttl = int(os.getenv("EVAL_HTTP_DNS_TTL", 5 * 60))
+
+    # Results of deterministic evals, kept for `cache_ttl` seconds
+    cache_ttl = int(os.getenv("EVAL_CACHE_TTL", 60 * 60))
+    cache_max_bytes = int(os.getenv("EVAL_CACHE_MAX_BYTES", 4 * 2 ** 20))
+
+    # Evals running at once, and how many may wait, in total and for a single user
+    max_running = int(os.getenv("EVAL_MAX_RUNNING", 4))
+    max_queue = int(os.getenv("EVAL_MAX_QUEUE", 20))
+    max_queue_per_user = int(os.getenv("EVAL_MAX_QUEUE_PER_USER", 2))
+    # Seconds an eval may run before it is stopped, not counting its wait in the queue
+    job_timeout = int(os.getenv("EVAL_JOB_TIMEOUT", 30))
+    # Minutes between saves of the per-language eval stats to the database
+    stats_flush_minutes = int(os.getenv("EVAL_STATS_FLUSH_MINUTES", 5))
+    # Seconds during which editing an eval message runs it again, editing its response
+    rerun_window = int(os.getenv("EVAL_RERUN_WINDOW", 10 * 60))
+    # Code blocks a single `eval multi` may run
+    multi_max_jobs = int(os.getenv("EVAL_MULTI_MAX_JOBS", 4))
+
+    # Output of a tio.run job kept in memory, the rest is dropped as it is read
+    max_output_bytes = int(os.getenv("EVAL_MAX_OUTPUT_BYTES", 128 * 2 ** 10))
+
+    # Seconds each paste service gets, and how many failures in a row skip it for a while
+    paste_timeout = int(os.getenv("EVAL_PASTE_TIMEOUT", 10))
+    paste_failure_threshold = int(os.getenv("EVAL_PASTE_FAILURE_THRESHOLD", 3))
+    paste_reset_timeout = int(os.getenv("EVAL_PASTE_RESET_TIMEOUT", 5 * 60))
+    # Outputs are attached instead while uploads take longer than this, in seconds
+    paste_slow_seconds = int(os.getenv("EVAL_PASTE_SLOW_SECONDS", 3))
+    # Attached outputs longer than this, in characters, are gzipped
+    attachment_gzip_threshold = int(
+        os.getenv("EVAL_ATTACHMENT_GZIP_THRESHOLD", 32 * 2 ** 10)
+    )
+
+    # Where the languages tio.run supports are saved between restarts
+    languages_cache = pathlib.Path(
+        os.getenv("EVAL_LANGUAGES_CACHE", "cache/eval_languages.json")
+    )
+
+    # Run the languages installed on the host in a local sandbox instead of on tio.run
+    local_backend = os.getenv("EVAL_LOCAL_BACKEND", "false").lower() == "true"
+    local_cpu_seconds = int(os.getenv("EVAL_LOCAL_CPU_SECONDS", 5))
+    local_wall_seconds = int(os.getenv("EVAL_LOCAL_WALL_SECONDS", 10))
+    local_memory_bytes = int(os.getenv("EVAL_LOCAL_MEMORY_BYTES", 512 * 2 ** 20))
+    # Processes all the local jobs may run at once, as they run as the same user
+    local_max_processes = int(os.getenv("EVAL_LOCAL_MAX_PROCESSES", 64))
+    # Unprivileged user and group the local jobs run as, nobody by default
+    local_uid = int(os.getenv("EVAL_LOCAL_UID", 65534))
+    local_gid = int(os.getenv("EVAL_LOCAL_GID", 65534))
+
+
+class LoopMonitoring(NamedTuple):
+    # Seconds between measures of the event loop lag, and how many measures are kept
+    lag_interval = float(os.getenv("LOOP_LAG_INTERVAL", 0.5))
+    lag_samples = int(os.getenv("LOOP_LAG_SAMPLES", 1200))
+    # Task steps holding the event loop longer than this, in seconds, are recorded
+    slow_step_seconds = float(os.getenv("LOOP_SLOW_STEP_SECONDS", 0.1))
+    slow_steps_kept = int(os.getenv("LOOP_SLOW_STEPS_KEPT", 50))
+
+
 # Bot replies
 with pathlib.Path("bot/resources/bot_replies.yml").open(encoding="utf8") as file:
     bot_replies = yaml.safe_load(file)
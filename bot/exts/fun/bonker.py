@@ -1,117 +1,518 @@
 import asyncio
 import functools
-from concurrent import futures
+import os
+import threading
 from io import BytesIO
-from typing import Dict
+from pathlib import Path
+from time import perf_counter
+from typing import Dict, List, NamedTuple, Optional, Tuple
 
 import disnake
 from disnake.ext import commands
 from loguru import logger
-from PIL import Image, ImageDraw, ImageFile, ImageSequence
+from PIL import Image, ImageDraw, ImageFile, ImageSequence, features
+
+from bot.bot import Bot
+from bot.constants import Images
+from bot.utils import gif
+from bot.utils.cache import DiskCache, LRUCache
+from bot.utils.render import RenderQueueFull
 
 ImageFile.LOAD_TRUNCATED_IMAGES = True
 
 LARGE_DIAMETER = 110
 SMALL_DIAMETER = 80
 
-# Two masks, one for the normal size, and a smaller one for the final stage of the bonk
-LARGE_MASK = Image.new("L", (LARGE_DIAMETER,) * 2)
-draw = ImageDraw.Draw(LARGE_MASK)
-draw.ellipse((0, 0, LARGE_DIAMETER, LARGE_DIAMETER), fill=255)
-
-SMALL_MASK = Image.new("L", (SMALL_DIAMETER,) * 2)
-draw = ImageDraw.Draw(SMALL_MASK)
-draw.ellipse((0, 0, SMALL_DIAMETER, SMALL_DIAMETER), fill=255)
-
-BONK_GIF = Image.open("bot/resources/images/yodabonk.gif")
+BONK_GIF_PATH = Path("bot/resources/images/yodabonk.gif")
 
 PFP_ENTRY_FRAME = 31
 BONK_FRAME = 43
 PFP_EXIT_FRAME = 56
 PFP_CENTRE = (355, 73)
 
+# Animated WebP settings, favouring encode speed over size
+WEBP_QUALITY = 75
+WEBP_METHOD = 0
+WEBP_SUPPORTED = features.check("webp_anim")
+
+
+@functools.lru_cache()
+def _circle_mask(diameter: int) -> Image.Image:
+    """Create a mask of a circle filling a square of `diameter` pixels."""
+    mask = Image.new("L", (diameter,) * 2)
+    ImageDraw.Draw(mask).ellipse((0, 0, diameter, diameter), fill=255)
+    return mask
+
+
+class RenderOptions(NamedTuple):
+    """How a bonk gif is encoded, trading file size against quality and encode time."""
+
+    # "adaptive" gives every frame its own palette, "global" maps all of them to one palette
+    palette: str = Images.bonk_palette
+    # Palette entries reserved for the avatar in the global palette
+    avatar_colours: int = Images.bonk_avatar_colours
+    # Dithering when mapping to the global palette
+    dither: bool = Images.bonk_dither
+    # Largest luma change of a pixel that isn't redrawn, None to disable frame differencing
+    diff_threshold: Optional[int] = Images.bonk_diff_threshold
+    # Every other frame at half the resolution, for when renders are piling up
+    lite: bool = False
+    # "gif" or "webp", the palette and differencing options only apply to gifs
+    format: str = "gif"
+
+
+class StaticFrames(NamedTuple):
+    """The template frames without the avatar, encoded once for a differencing threshold."""
+
+    blocks: Dict[int, bytes]
+    # What is on screen right before the first avatar frame, for differencing against
+    displayed: Optional[Image.Image]
+
+
+class TemplateFrame(NamedTuple):
+    """A single decoded frame of the bonk template."""
+
+    image: Image.Image
+    duration: int
+    disposal: int
+    # Position of the frame in the template gif
+    number: int
+
+    @property
+    def has_avatar(self) -> bool:
+        """Whether the avatar is pasted onto this frame."""
+        return PFP_ENTRY_FRAME <= self.number <= PFP_EXIT_FRAME
+
+
+class FrameBank:
+    """
+    The bonk template decoded once into RGBA frames.
+
+    Decoding the ~3.4 MB template dominates render time, so it is done a single time per
+    process and every render only composites the avatar onto copies of these frames.
+    """
+
+    def __init__(
+        self, frames: List[TemplateFrame], size: Tuple[int, int], scale: int = 1
+    ) -> None:
+        self.frames = frames
+        self.size = size
+        # How many times smaller than the template the frames are
+        self.scale = scale
+
+    @classmethod
+    def from_gif(cls, gif: Image.Image) -> "FrameBank":
+        """Decode every frame of `gif` along with its duration and disposal method."""
+        default_duration = gif.info.get("duration", 50)
+        frames = [
+            TemplateFrame(
+                image=frame.convert("RGBA"),
+                duration=frame.info.get("duration", default_duration),
+                disposal=getattr(frame, "disposal_method", 0),
+                number=number,
+            )
+            for number, frame in enumerate(ImageSequence.Iterator(gif))
+        ]
+        gif.seek(0)
+        return cls(frames, gif.size)
+
+    def halved(self) -> "FrameBank":
+        """
+        Return every other frame at half the resolution, each shown for twice as long.
+
+        The frames with the same parity as the bonk frame are kept, so the bonk isn't lost.
+        """
+        frames = []
+        duration = 0
+        for frame in self.frames:
+            duration += frame.duration
+            if frame.number % 2 == BONK_FRAME % 2:
+                frames.append(
+                    frame._replace(image=frame.image.reduce(2), duration=duration)
+                )
+                duration = 0
+
+        if duration:
+            frames[-1] = frames[-1]._replace(duration=frames[-1].duration + duration)
+        return FrameBank(frames, frames[0].image.size, self.scale * 2)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the decoded frame buffers, in bytes."""
+        return sum(
+            frame.image.width * frame.image.height * len(frame.image.getbands())
+            for frame in self.frames
+        )
+
+    def __len__(self) -> int:
+        return len(self.frames)
+
+
+class BonkTemplate:
+    """
+    Every asset derived from the bonk template gif.
+
+    The assets are only loaded on first use, so boot and extension reloads don't pay for
+    them. Loading is guarded by a lock as renders can run concurrently.
+    """
+
+    _instance: Optional["BonkTemplate"] = None
+    _lock = threading.Lock()
+
+    def __init__(self) -> None:
+        with Image.open(BONK_GIF_PATH) as bonk_gif:
+            self.frame_bank = FrameBank.from_gif(bonk_gif)
+        self._lite_frame_bank: Optional[FrameBank] = None
+
+        self._static_frames: Dict[Tuple[bool, Optional[int]], StaticFrames] = {}
+        self._palettes: Dict[int, bytes] = {}
+        self._derived_lock = threading.Lock()
+
+        # Encode the static frames for the default options right away, so pre-warming does it
+        self.static_frames(False, RenderOptions().diff_threshold)
+
+    def frames(self, lite: bool) -> FrameBank:
+        """Return the frames to render, halved in lite mode."""
+        if not lite:
+            return self.frame_bank
+
+        with self._derived_lock:
+            if self._lite_frame_bank is None:
+                self._lite_frame_bank = self.frame_bank.halved()
+            return self._lite_frame_bank
+
+    def static_frames(self, lite: bool, diff_threshold: Optional[int]) -> StaticFrames:
+        """
+        Return the encoded frames outside the avatar range, identical for every bonk.
+
+        The frames are encoded once for each mode and differencing threshold, with their own
+        palettes.
+        """
+        frame_bank = self.frames(lite)
+        with self._derived_lock:
+            if (lite, diff_threshold) not in self._static_frames:
+                blocks = {}
+                displayed = None
+                avatar_reached = False
+                encoder = gif.FrameEncoder(diff_threshold=diff_threshold)
+                for i, frame in enumerate(frame_bank.frames):
+                    if frame.has_avatar:
+                        if not avatar_reached:
+                            displayed = encoder.displayed
+                            avatar_reached = True
+                        # The first frame after the avatar can't depend on the avatar frames
+                        encoder = gif.FrameEncoder(diff_threshold=diff_threshold)
+                        continue
+                    blocks[i] = encoder.encode(
+                        frame.image, frame.duration, frame.disposal
+                    )
+
+                self._static_frames[lite, diff_threshold] = StaticFrames(
+                    blocks, displayed
+                )
+            return self._static_frames[lite, diff_threshold]
+
+    def palette(self, colours: int) -> bytes:
+        """Return a palette of `colours` entries for the avatar-bearing template frames."""
+        with self._derived_lock:
+            if colours not in self._palettes:
+                # Quantizing downscaled frames is much faster and the colours barely differ
+                frames = [
+                    frame.image.convert("RGB").reduce(4)
+                    for frame in self.frame_bank.frames
+                    if frame.has_avatar
+                ]
+                width, height = frames[0].size
+                montage = Image.new("RGB", (width, height * len(frames)))
+                for i, frame in enumerate(frames):
+                    montage.paste(frame, (0, height * i))
+
+                palette = montage.quantize(colours).getpalette()[: colours * 3]
+                self._palettes[colours] = bytes(palette).ljust(colours * 3, b"\x00")
+            return self._palettes[colours]
+
+    @classmethod
+    def get(cls) -> "BonkTemplate":
+        """Return the template assets, loading them if this is the first use."""
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    start = perf_counter()
+                    cls._instance = cls()
+                    logger.info(
+                        f"Bonk template loaded in {perf_counter() - start:.2f}s: "
+                        f"{len(cls._instance.frame_bank)} frames, "
+                        f"{cls._instance.nbytes / 2 ** 20:.1f} MiB."
+                    )
+        return cls._instance
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the decoded frames and the encoded static frames, in bytes."""
+        static_nbytes = sum(
+            sum(map(len, static.blocks.values()))
+            + (len(static.displayed.tobytes()) if static.displayed else 0)
+            for static in self._static_frames.values()
+        )
+        lite_nbytes = self._lite_frame_bank.nbytes if self._lite_frame_bank else 0
+        return self.frame_bank.nbytes + lite_nbytes + static_nbytes
+
 
 class Bonk(commands.Cog):
     """Cog for sending bonking gifs."""
 
-    def __init__(self, bot: commands.Bot):
+    def __init__(self, bot: Bot):
         self.bot = bot
+        self.cache = LRUCache(Images.bonk_cache_max_bytes)
+        self.disk_cache = (
+            # Gifs and WebPs share the directory, so the files get no extension
+            DiskCache(Images.bonk_cache_dir, Images.bonk_disk_cache_max_bytes)
+            if Images.bonk_cache_dir
+            else None
+        )
+
+        # Bytes held by the template in each render worker that reported loading it, by PID
+        self.template_workers: Dict[int, int] = {}
+
+        if Images.bonk_prewarm:
+            self.bot.loop.create_task(self._prewarm_template())
 
     @staticmethod
-    def _generate_frame(
-        frame_number: int, frame: Image.Image, pfps_by_size: Dict[str, int]
-    ) -> Image.Image:
-        canvas = Image.new("RGBA", BONK_GIF.size)
-        canvas.paste(frame.convert("RGBA"), (0, 0))
-
-        if PFP_ENTRY_FRAME <= frame_number <= PFP_EXIT_FRAME:
-            if frame_number == BONK_FRAME:
-                canvas.paste(
-                    pfps_by_size["small"],
-                    (
-                        PFP_CENTRE[0] - SMALL_DIAMETER // 2,
-                        PFP_CENTRE[1]
-                        - SMALL_DIAMETER // 2
-                        + 10,  # Shift avatar down by 10 px in the bonk frame
-                    ),
-                    SMALL_MASK,
-                )
+    def _load_template() -> Tuple[int, int]:
+        """Load the template assets, returning the process ID and the bytes they hold."""
+        return os.getpid(), BonkTemplate.get().nbytes
+
+    async def _prewarm_template(self) -> None:
+        """Load the template in the render workers in the background once the bot is ready."""
+        await self.bot.wait_until_ready()
+
+        render_service = self.bot.render_service
+        results = await asyncio.gather(
+            *(
+                render_service.submit(self._load_template)
+                for _ in range(render_service.workers)
+            ),
+            return_exceptions=True,
+        )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.warning(f"Failed to pre-warm the bonk template: {result!r}")
             else:
-                canvas.paste(
-                    pfps_by_size["large"],
-                    (
-                        PFP_CENTRE[0] - LARGE_DIAMETER // 2,
-                        PFP_CENTRE[1] - LARGE_DIAMETER // 2,
-                    ),
-                    LARGE_MASK,
+                pid, nbytes = result
+                self.template_workers[pid] = nbytes
+                logger.info(
+                    f"Bonk template warm in render worker {pid} "
+                    f"({nbytes / 2 ** 20:.1f} MiB)."
                 )
 
+    async def _get_cached(self, key: str) -> Optional[bytes]:
+        """Look up a rendered gif in the memory cache, then in the disk cache."""
+        if (out_gif := self.cache.get(key)) is not None:
+            return out_gif
+
+        if self.disk_cache is None:
+            return None
+
+        out_gif = await asyncio.to_thread(self.disk_cache.get, key)
+        if out_gif is not None:
+            self.cache.set(key, out_gif)
+        return out_gif
+
+    async def _set_cached(self, key: str, out_gif: bytes) -> None:
+        """Store a rendered gif in every cache tier."""
+        self.cache.set(key, out_gif)
+        if self.disk_cache is not None:
+            await asyncio.to_thread(self.disk_cache.set, key, out_gif)
+
+    @staticmethod
+    def _generate_frame(
+        frame: TemplateFrame, pfps_by_size: Dict[str, Image.Image], scale: int
+    ) -> Image.Image:
+        if not frame.has_avatar:
+            # Frames without the avatar are never modified, so they can be reused as is
+            return frame.image
+
+        canvas = frame.image.copy()
+        centre_x, centre_y = PFP_CENTRE[0] // scale, PFP_CENTRE[1] // scale
+        if frame.number == BONK_FRAME:
+            pfp = pfps_by_size["small"]
+            centre_y += 10 // scale  # Shift avatar down by 10 px in the bonk frame
+        else:
+            pfp = pfps_by_size["large"]
+
+        canvas.paste(
+            pfp,
+            (centre_x - pfp.width // 2, centre_y - pfp.height // 2),
+            _circle_mask(pfp.width),
+        )
         return canvas
 
-    def _generate_gif(self, pfp: bytes) -> BytesIO:
-        logger.trace("Starting bonk gif generation.")
+    @staticmethod
+    def _build_palette(
+        template: BonkTemplate, pfp: Image.Image, options: RenderOptions
+    ) -> bytes:
+        """Build the global palette: template colours, then the avatar's colours."""
+        avatar_colours = max(1, min(options.avatar_colours, gif.TRANSPARENT_INDEX - 1))
+        avatar_palette = pfp.convert("RGB").quantize(avatar_colours).getpalette()
+        return template.palette(gif.TRANSPARENT_INDEX - avatar_colours) + bytes(
+            avatar_palette[: avatar_colours * 3]
+        ).ljust(avatar_colours * 3, b"\x00")
 
-        pfp = Image.open(BytesIO(pfp))
-        pfps_by_size = {
-            "large": pfp.resize((LARGE_DIAMETER,) * 2),
-            "small": pfp.resize((SMALL_DIAMETER,) * 2),
-        }
+    @staticmethod
+    def _encode_gif(
+        template: BonkTemplate,
+        pfps_by_size: Dict[str, Image.Image],
+        options: RenderOptions,
+    ) -> bytes:
+        frame_bank = template.frames(options.lite)
+        palette = None
+        if options.palette == "global":
+            palette = Bonk._build_palette(template, pfps_by_size["large"], options)
+
+        static_frames = template.static_frames(options.lite, options.diff_threshold)
+        encoder = gif.FrameEncoder(
+            palette, options.diff_threshold, options.dither, static_frames.displayed
+        )
+        frames = [
+            static_frames.blocks[i]
+            if i in static_frames.blocks
+            else encoder.encode(
+                Bonk._generate_frame(frame, pfps_by_size, frame_bank.scale),
+                frame.duration,
+                frame.disposal,
+            )
+            for i, frame in enumerate(frame_bank.frames)
+        ]
+        return gif.assemble(frame_bank.size, frames, palette=palette)
 
-        out_images = [
-            self._generate_frame(i, frame, pfps_by_size)
-            for i, frame in enumerate(ImageSequence.Iterator(BONK_GIF))
+    @staticmethod
+    def _encode_webp(
+        template: BonkTemplate,
+        pfps_by_size: Dict[str, Image.Image],
+        options: RenderOptions,
+    ) -> bytes:
+        frame_bank = template.frames(options.lite)
+        frames = [
+            Bonk._generate_frame(frame, pfps_by_size, frame_bank.scale)
+            for frame in frame_bank.frames
         ]
 
-        out_gif = BytesIO()
-        out_images[0].save(
-            out_gif,
-            "GIF",
+        buffer = BytesIO()
+        frames[0].save(
+            buffer,
+            "WEBP",
             save_all=True,
-            append_images=out_images[1:],
+            append_images=frames[1:],
+            duration=[frame.duration for frame in frame_bank.frames],
             loop=0,
-            duration=50,
+            quality=WEBP_QUALITY,
+            method=WEBP_METHOD,
         )
+        return buffer.getvalue()
+
+    @staticmethod
+    def _generate_gif(pfp: bytes, options: RenderOptions = RenderOptions()) -> bytes:
+        """Render the bonk animation of `pfp` in the format given by `options`."""
+        logger.trace("Starting bonk gif generation.")
+        start = perf_counter()
+        template = BonkTemplate.get()
+
+        scale = template.frames(options.lite).scale
+        pfp = Image.open(BytesIO(pfp)).convert("RGBA")
+        pfps_by_size = {
+            "large": pfp.resize((LARGE_DIAMETER // scale,) * 2),
+            "small": pfp.resize((SMALL_DIAMETER // scale,) * 2),
+        }
+
+        if options.format == "webp":
+            out_gif = Bonk._encode_webp(template, pfps_by_size, options)
+        else:
+            out_gif = Bonk._encode_gif(template, pfps_by_size, options)
 
-        logger.trace("Bonk gif generated.")
+        logger.debug(
+            f"Bonk gif generated with {options}: {len(out_gif) / 2 ** 20:.2f} MiB "
+            f"in {perf_counter() - start:.3f}s."
+        )
         return out_gif
 
     @commands.command()
-    @commands.max_concurrency(3)
-    async def bonk(self, ctx: commands.Context, member: disnake.User) -> None:
-        """Sends gif of mentioned member being "bonked" by Yoda."""
-        pfp = await member.display_avatar.read()
-        created_at = ctx.message.created_at.strftime("%Y-%m-%d_%H-%M")
-        out_filename = f"bonk_{member.id}_{created_at}.gif"
-        func = functools.partial(self._generate_gif, pfp)
+    async def bonk(
+        self, ctx: commands.Context, member: disnake.User, *modes: str
+    ) -> None:
+        """
+        Sends gif of mentioned member being "bonked" by Yoda.
+
+        Add `lite` for a smaller, choppier gif, and `webp` for an animated WebP instead.
+        Lite mode is used automatically while lots of bonks are being rendered.
+        """
+        if unknown_modes := set(modes) - {"lite", "webp"}:
+            raise commands.BadArgument(
+                f"Unknown bonk mode {', '.join(sorted(unknown_modes))}, "
+                "the modes are `lite` and `webp`."
+            )
+        if "webp" in modes and not WEBP_SUPPORTED:
+            await ctx.send("Sorry, WebP bonks aren't supported on this bot.")
+            return
+
+        options = RenderOptions()._replace(
+            lite="lite" in modes, format="webp" if "webp" in modes else "gif"
+        )
+        queue_message: Optional[disnake.Message] = None
+        note = None
+
+        async def show_queue_position(position: int) -> None:
+            nonlocal queue_message
+            content = f"Lots of bonking going on, you are #{position} in the queue..."
+            if queue_message is None:
+                queue_message = await ctx.send(content)
+            else:
+                await queue_message.edit(content=content)
+
+        def cache_key() -> str:
+            # The asset key changes whenever the avatar does, so it identifies the render
+            return "-".join(map(str, (member.display_avatar.key, *options)))
 
         async with ctx.typing():
-            with futures.ThreadPoolExecutor() as pool:
-                out_gif = await asyncio.get_running_loop().run_in_executor(pool, func)
+            out_gif = await self._get_cached(cache_key())
+
+            if (
+                out_gif is None
+                and not options.lite
+                and self.bot.render_service.queue_depth >= Images.bonk_lite_queue_depth
+            ):
+                options = options._replace(lite=True)
+                note = "Lots of bonking going on, so here's a lite bonk."
+                out_gif = await self._get_cached(cache_key())
+
+            if out_gif is None:
+                pfp = await self.bot.avatar_service.fetch(
+                    member.display_avatar,
+                    LARGE_DIAMETER // 2 if options.lite else LARGE_DIAMETER,
+                )
+                try:
+                    out_gif = await self.bot.render_service.submit(
+                        self._generate_gif,
+                        pfp,
+                        options,
+                        on_position=show_queue_position,
+                    )
+                except RenderQueueFull:
+                    await ctx.send(
+                        "Too many bonks are being rendered right now, try again later."
+                    )
+                    return
+                finally:
+                    if queue_message is not None:
+                        await queue_message.delete()
+
+                await self._set_cached(cache_key(), out_gif)
 
-            out_gif.seek(0)
-            await ctx.send(file=disnake.File(out_gif, out_filename))
+            logger.debug(f"Bonk cache: {self.cache.stats!r}")
+            created_at = ctx.message.created_at.strftime("%Y-%m-%d_%H-%M")
+            out_filename = f"bonk_{member.id}_{created_at}.{options.format}"
+            await ctx.send(note, file=disnake.File(BytesIO(out_gif), out_filename))
 
 
-def setup(bot: commands.Bot) -> None:
+def setup(bot: Bot) -> None:
     """Load the Bonk cog."""
     bot.add_cog(Bonk(bot))
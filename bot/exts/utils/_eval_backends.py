@@ -0,0 +1,511 @@
+import asyncio
+import hashlib
+import os
+import re
+import resource
+import shutil
+import signal
+import subprocess
+import tempfile
+from abc import ABC, abstractmethod
+from collections import Counter
+from contextlib import suppress
+from pathlib import Path
+from time import perf_counter
+from typing import Container, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import aiohttp
+from loguru import logger
+from yaml import safe_load
+
+from bot.utils.cache import LRUCache
+
+from ._eval_helper import TRUNCATED_ERROR, EvalOutput, Tio
+
+# Output is capped like tio.run's, see TRUNCATED_ERROR
+MAX_OUTPUT_BYTES = 128 * 2 ** 10
+
+
+class EvalBackendError(Exception):
+    """Raised when a backend couldn't run an eval job, so another one should be tried."""
+
+    pass
+
+
+class EvalJob(NamedTuple):
+    """Code to evaluate, along with everything passed to it."""
+
+    language: str
+    code: str
+    inputs: str = ""
+    compiler_flags: Tuple[str, ...] = ()
+    command_line_options: Tuple[str, ...] = ()
+    args: Tuple[str, ...] = ()
+
+
+class EvalBackend(ABC):
+    """
+    Something that runs eval jobs.
+
+    The output is formatted like tio.run's, ending with the timing stats and the exit code,
+    as that's what the rest of the eval command parses. Jobs a backend had to kill have
+    no exit code.
+    """
+
+    name = "backend"
+
+    @abstractmethod
+    def supports(self, language: str) -> bool:
+        """Whether this backend can run code in `language`."""
+
+    def can_run(self, job: EvalJob) -> bool:
+        """Whether this backend can run `job`, with all of its options."""
+        return self.supports(job.language)
+
+    @abstractmethod
+    async def run(self, job: EvalJob) -> str:
+        """Run `job` and return its output, raising EvalBackendError if that failed."""
+
+
+class TioBackend(EvalBackend):
+    """Runs jobs on tio.run, which supports hundreds of languages."""
+
+    name = "tio"
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        languages: Container[str],
+        max_output_bytes: int,
+    ) -> None:
+        self.session = session
+        self.languages = languages
+        self.max_output_bytes = max_output_bytes
+
+    def supports(self, language: str) -> bool:
+        """Whether tio.run listed `language` the last time the languages were refreshed."""
+        return language in self.languages
+
+    async def run(self, job: EvalJob) -> str:
+        """Send `job` to tio.run and return its output."""
+        tio = Tio(
+            job.language,
+            job.code,
+            job.inputs,
+            list(job.compiler_flags),
+            list(job.command_line_options),
+            list(job.args),
+        )
+        try:
+            return await tio.get_result(self.session, self.max_output_bytes)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise EvalBackendError(f"tio.run request failed: {e!r}") from e
+
+
+class LocalLanguage(NamedTuple):
+    """How the local backend runs a language."""
+
+    file: str
+    command: Tuple[str, ...]
+
+
+class SandboxLimits(NamedTuple):
+    """Resources a locally run job may use."""
+
+    cpu_seconds: int
+    wall_seconds: float
+    memory_bytes: int
+    # Shared by all the running jobs, as they run as the same user
+    max_processes: int
+
+
+class LocalBackend(EvalBackend):
+    """
+    Runs jobs in sandboxed subprocesses on the host, for the languages installed on it.
+
+    Every job runs under bubblewrap as an unprivileged user, in new namespaces with no
+    network and its own process tree. It only sees a read-only copy of the system
+    directories, an empty temporary working directory and a minimal environment, so the
+    bot's files and secrets are out of its reach. CPU time, memory, output, processes
+    and wall time are capped.
+    """
+
+    name = "local"
+
+    # Read-only system directories of the sandbox, those missing on the host are skipped
+    SYSTEM_DIRS = (
+        "/usr",
+        "/bin",
+        "/sbin",
+        "/lib",
+        "/lib32",
+        "/lib64",
+        "/etc/alternatives",
+    )
+    # Where the working directory is mounted in the sandbox, and the PATH of the jobs
+    WORK_DIR = "/sandbox"
+    PATH = "/usr/local/bin:/usr/bin:/bin"
+
+    def __init__(
+        self,
+        languages: Dict[str, LocalLanguage],
+        limits: SandboxLimits,
+        uid: int,
+        gid: int,
+    ) -> None:
+        self.languages = languages
+        self.limits = limits
+        self.uid = uid
+        self.gid = gid
+
+    @classmethod
+    def from_config(
+        cls, path: Path, limits: SandboxLimits, uid: int, gid: int
+    ) -> Optional["LocalBackend"]:
+        """
+        Create a backend for the languages configured in `path` that are installed.
+
+        None is returned if the sandbox can't be created on this host, which takes
+        bubblewrap and the permission to run processes as `uid`.
+        """
+        with path.open(encoding="utf8") as file:
+            config = safe_load(file)
+
+        languages = {
+            name: LocalLanguage(language["file"], tuple(language["command"]))
+            for name, language in config.items()
+            if shutil.which(language["command"][0], path=cls.PATH)
+        }
+        backend = cls(languages, limits, uid, gid)
+
+        try:
+            backend._probe("true")
+        except (OSError, subprocess.SubprocessError, EvalBackendError) as e:
+            logger.warning(f"Local eval backend disabled, no sandbox: {e!r}")
+            return None
+
+        # A language that can't start within the limits would crash on every job
+        for name, language in list(languages.items()):
+            try:
+                backend._probe(*language.command, file=language.file)
+            except (OSError, subprocess.SubprocessError, EvalBackendError) as e:
+                logger.warning(
+                    f"Local eval of {name} disabled, it failed to run: {e!r}"
+                )
+                del languages[name]
+
+        logger.info(
+            f"Local eval backend enabled for {', '.join(languages) or 'nothing'}."
+        )
+        return backend
+
+    def _probe(self, *command: str, file: Optional[str] = None) -> None:
+        """Run `command` in the sandbox with an empty `file`, raising if it failed."""
+        with tempfile.TemporaryDirectory(prefix="eval-") as directory:
+            if file is not None:
+                Path(directory, file).touch()
+            self._prepare(directory)
+            process = subprocess.run(
+                self._sandbox_command(directory, command),
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                timeout=self.limits.wall_seconds,
+                env=self._environment(),
+            )
+        if process.returncode:
+            raise EvalBackendError(f"{command[0]} exited with {process.returncode}")
+
+    def supports(self, language: str) -> bool:
+        """Whether `language` is configured and installed."""
+        return language in self.languages
+
+    def can_run(self, job: EvalJob) -> bool:
+        """Whether `job` can run locally, which excludes compiled languages' flags."""
+        return self.supports(job.language) and not job.compiler_flags
+
+    def _prepare(self, directory: str) -> None:
+        """Hand the working directory of a job over to the sandbox user."""
+        os.chown(directory, self.uid, self.gid)
+        for file in Path(directory).iterdir():
+            os.chown(file, self.uid, self.gid)
+
+    def _environment(self) -> Dict[str, str]:
+        return {"PATH": self.PATH, "HOME": self.WORK_DIR}
+
+    def _sandbox_command(self, directory: str, command: Sequence[str]) -> List[str]:
+        """Return the command running `command` in the sandbox, with `directory` mounted."""
+        limits = self.limits
+        system_dirs = [
+            arg for path in self.SYSTEM_DIRS for arg in ("--ro-bind-try", path, path)
+        ]
+        return [
+            # Set before dropping the privileges, so the job can't raise them again
+            "prlimit",
+            f"--cpu={limits.cpu_seconds}",
+            # Not RLIMIT_AS, which also counts the address space JITs like V8 only reserve
+            f"--data={limits.memory_bytes}",
+            f"--fsize={MAX_OUTPUT_BYTES}",
+            f"--nproc={limits.max_processes}",
+            "--core=0",
+            "--",
+            "setpriv",
+            f"--reuid={self.uid}",
+            f"--regid={self.gid}",
+            "--clear-groups",
+            "--no-new-privs",
+            "--",
+            "bwrap",
+            "--unshare-all",
+            "--die-with-parent",
+            "--new-session",
+            *system_dirs,
+            "--proc",
+            "/proc",
+            "--dev",
+            "/dev",
+            "--tmpfs",
+            "/tmp",
+            "--bind",
+            directory,
+            self.WORK_DIR,
+            "--chdir",
+            self.WORK_DIR,
+            "--",
+            *command,
+        ]
+
+    def _command(self, job: EvalJob, directory: str) -> List[str]:
+        command = self.languages[job.language].command
+        return self._sandbox_command(
+            directory,
+            (command[0], *job.command_line_options, *command[1:], *job.args),
+        )
+
+    async def _read_output(self, stdout: asyncio.StreamReader) -> Tuple[bytes, bool]:
+        """Read the output up to the cap, returning it and whether it was truncated."""
+        output = bytearray()
+        while chunk := await stdout.read(2 ** 16):
+            output += chunk
+            if len(output) > MAX_OUTPUT_BYTES:
+                return bytes(output[:MAX_OUTPUT_BYTES]), True
+        return bytes(output), False
+
+    async def _communicate(
+        self, process: asyncio.subprocess.Process, inputs: str
+    ) -> Tuple[bytes, bool]:
+        # The job may exit without reading its input
+        with suppress(BrokenPipeError, ConnectionResetError):
+            if inputs:
+                process.stdin.write(inputs.encode("utf-8"))
+                await process.stdin.drain()
+            process.stdin.close()
+
+        output, truncated = await self._read_output(process.stdout)
+        if not truncated:
+            await process.wait()
+        return output, truncated
+
+    async def run(self, job: EvalJob) -> str:
+        """Run `job` in a sandboxed subprocess and return its output."""
+        language = self.languages[job.language]
+        usage_before = resource.getrusage(resource.RUSAGE_CHILDREN)
+        start = perf_counter()
+
+        with tempfile.TemporaryDirectory(prefix="eval-") as directory:
+            Path(directory, language.file).write_text(job.code, encoding="utf-8")
+            try:
+                self._prepare(directory)
+                process = await asyncio.create_subprocess_exec(
+                    *self._command(job, directory),
+                    stdin=asyncio.subprocess.PIPE,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.STDOUT,
+                    env=self._environment(),
+                    start_new_session=True,
+                )
+            except OSError as e:
+                raise EvalBackendError(f"Couldn't start {job.language}: {e!r}") from e
+
+            timed_out = killed = False
+            try:
+                output, truncated = await asyncio.wait_for(
+                    self._communicate(process, job.inputs), self.limits.wall_seconds
+                )
+            except asyncio.TimeoutError:
+                output, truncated, timed_out = b"", False, True
+            finally:
+                if process.returncode is None:
+                    # bubblewrap takes the job's whole process namespace down with it
+                    with suppress(ProcessLookupError):
+                        os.killpg(process.pid, signal.SIGKILL)
+                    await process.wait()
+                    killed = True
+
+        real_time = perf_counter() - start
+        # Approximate when other jobs finish at the same time, as the usage is process-wide
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        user_time = usage.ru_utime - usage_before.ru_utime
+        sys_time = usage.ru_stime - usage_before.ru_stime
+
+        text = output.decode("utf-8", errors="replace")
+        if timed_out:
+            text += f"\nThe job timed out after {self.limits.wall_seconds:g} seconds."
+        result = (
+            f"{text}\n"
+            f"Real time: {real_time:.3f} s\n"
+            f"User time: {user_time:.3f} s\n"
+            f"Sys. time: {sys_time:.3f} s\n"
+            f"CPU share: {(user_time + sys_time) / real_time * 100:.2f} %\n"
+        )
+        if not killed:
+            exit_code = process.returncode
+            if exit_code < 0:
+                exit_code = (
+                    128 - exit_code
+                )  # Killed by a signal, report it like a shell would
+            result += f"Exit code: {exit_code}"
+        # Otherwise the exit code would be the bot's SIGKILL, not anything the job did
+        return result + (TRUNCATED_ERROR if truncated else "")
+
+
+class EvalResult(NamedTuple):
+    """The output of an eval job, and where it came from."""
+
+    output: str
+    backend: str
+    cached: bool = False
+
+
+class EvalRouter:
+    """
+    Runs each job on the first backend that supports its language.
+
+    Backends are tried in order, so if one fails the next one supporting the language
+    gets the job. Identical jobs submitted while one is running share its result. A shared
+    job is only cancelled once every requester waiting for it went away.
+
+    Caching is conservative, as a missed hit only costs a run while a wrong one shows a
+    stale output. A result is only cached if the job's code and options mention none of
+    the NONDETERMINISTIC patterns, and the job exited on its own with a code below 124,
+    without being truncated or printing anything that looks like a memory address.
+    """
+
+    # Code mentioning any of these likely gives a different output on every run. Object
+    # identities and the iteration order of sets change between runs with hash
+    # randomization, so `id(`, sets and set-like literals count too.
+    NONDETERMINISTIC = re.compile(
+        r"rand|time|date|now|clock|uuid|getpid|hash|environ|thread|secret|%p"
+        r"|\bid\(|\bset\b|frozenset|\{[^{}:]*,[^{}:]*\}",
+        re.IGNORECASE,
+    )
+    # Default reprs and pointers, which differ on every run
+    ADDRESS = re.compile(r"0x[0-9a-f]{6,}", re.IGNORECASE)
+    # Exit codes from here up are timeouts, failures to start and signals, which
+    # depend on the load of the backend as much as on the code
+    MAX_CACHED_EXIT_CODE = 123
+
+    def __init__(self, backends: Sequence[EvalBackend], cache: LRUCache) -> None:
+        self.backends = backends
+        self.cache = cache
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[str, int] = Counter()
+
+    @staticmethod
+    def cache_key(job: EvalJob) -> str:
+        """Return a digest identifying `job` by its language, code and every option."""
+        return hashlib.sha256(repr(tuple(job)).encode("utf-8")).hexdigest()
+
+    def is_deterministic(self, job: EvalJob) -> bool:
+        """Whether `job` is expected to give the same output every time it runs."""
+        return not any(
+            self.NONDETERMINISTIC.search(text)
+            for text in (job.code, *job.command_line_options, *job.args)
+        )
+
+    def is_cacheable(self, output: str) -> bool:
+        """Whether the output of a deterministic job is clean enough to be reused."""
+        parsed = EvalOutput.parse(output, stats=False)
+        return (
+            not parsed.truncated
+            and parsed.exit_code is not None
+            and parsed.exit_code.isdigit()
+            and int(parsed.exit_code) <= self.MAX_CACHED_EXIT_CODE
+            and not self.ADDRESS.search(parsed.body)
+        )
+
+    def cached(self, job: EvalJob) -> Optional[EvalResult]:
+        """Return the cached result of `job`, if there is one."""
+        if not self.is_deterministic(job):
+            return None
+
+        if (result := self.cache.get(self.cache_key(job))) is not None:
+            return result._replace(cached=True)
+        return None
+
+    def supports(self, language: str) -> bool:
+        """Whether any backend can run code in `language`."""
+        return any(backend.supports(language) for backend in self.backends)
+
+    async def run(self, job: EvalJob, use_cache: bool = True) -> EvalResult:
+        """
+        Run `job` and return its result, raising EvalBackendError if no backend could.
+
+        With `use_cache` False the job is always run, and its result isn't shared.
+        """
+        if not use_cache or not self.is_deterministic(job):
+            return await self._run(job)
+
+        if (result := self.cached(job)) is not None:
+            return result
+
+        key = self.cache_key(job)
+        if (task := self._in_flight.get(key)) is None:
+            task = asyncio.create_task(self._run_and_cache(job, key))
+            self._in_flight[key] = task
+            # Not in the coroutine, which never runs if cancelled before it started
+            task.add_done_callback(lambda done: self._forget(key, done))
+
+        # Shield the run, so one requester going away doesn't cancel it for the others
+        self._waiters[key] += 1
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+                if not task.done():
+                    # Nobody wants the result anymore, free the backend right away
+                    task.cancel()
+                    # An identical job submitted before it's done cancelling gets a new run
+                    self._forget(key, task)
+
+    def _forget(self, key: str, task: asyncio.Task) -> None:
+        """Stop sharing `task` for `key`, unless it was already replaced by a new run."""
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+
+    async def _run_and_cache(self, job: EvalJob, key: str) -> EvalResult:
+        result = await self._run(job)
+        if self.is_cacheable(result.output):
+            self.cache.set(key, result)
+        return result
+
+    async def _run(self, job: EvalJob) -> EvalResult:
+        for backend in self.backends:
+            if not backend.can_run(job):
+                continue
+
+            start = perf_counter()
+            try:
+                output = await backend.run(job)
+            except EvalBackendError as e:
+                logger.warning(f"Eval backend {backend.name} failed, falling back: {e}")
+                continue
+
+            logger.debug(
+                f"Ran {job.language} job on {backend.name} in "
+                f"{perf_counter() - start:.3f}s."
+            )
+            return EvalResult(output, backend.name)
+
+        raise EvalBackendError(f"No eval backend could run the {job.language} job.")
@@ -1,18 +1,36 @@
+import asyncio
+import gzip
 import re
 import urllib.parse
 import zlib
 from functools import partial
 from io import BytesIO
-from typing import Any, Dict, List, Optional, Tuple, Union
+from time import monotonic, perf_counter
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple, Union
 
 import aiohttp
-from disnake import Embed
+from disnake import Embed, File
 from disnake.ext import commands
 from disnake.ext.commands import Context
 from loguru import logger
 
+from bot.utils.http import CircuitBreaker
+
 to_bytes = partial(bytes, encoding="utf-8")
 
+# tio.run truncates long outputs and appends this message after the exit code
+TRUNCATED_ERROR = "The output exceeded 128 KiB and was truncated."
+EXIT_CODE_PREFIX = "Exit code: "
+TIO_TOKEN_LENGTH = 16
+# The end of an output kept past the size cap, enough for the stats and the exit code
+TAIL_BYTES = 4 * 2 ** 10
+
+# Characters of the output encoded at once when it is gzipped
+GZIP_CHUNK = 16 * 2 ** 10
+
+HASTEBIN_LINK = "https://hastebin.com"
+BIN_LINK = "https://bin.drlazor.be/"
+
 
 def _to_tio_string(couple: tuple) -> bytes:
     """
@@ -75,35 +93,234 @@ class Tio:
         # This returns a DEFLATE-compressed byte-string, which is what the API requires
         self.request = zlib.compress(bytes_, 9)[2:-4]
 
-    async def get_result(self) -> str:
-        """Send Request to Tio Run API And Get Result."""
-        async with aiohttp.ClientSession() as client_session:
-            async with client_session.post(self.backend, data=self.request) as res:
-                if res.status != 200:
-                    logger.warning(
-                        f"HttpProcessingError while getting result of code from tio api with "
-                        f"status code: {res.status}"
-                    )
+    async def get_result(self, session: aiohttp.ClientSession, max_bytes: int) -> str:
+        """
+        Send Request to Tio Run API And Get Result.
+
+        At most `max_bytes` of the output are kept, along with its end, which holds the
+        stats and the exit code.
+        """
+        async with session.post(self.backend, data=self.request) as res:
+            if res.status != 200:
+                logger.warning(
+                    f"HttpProcessingError while getting result of code from tio api with "
+                    f"status code: {res.status}"
+                )
+                res.raise_for_status()
+
+            return await read_tio_response(res.content, max_bytes)
+
+
+class _CappedBuffer:
+    """Bytes kept up to a cap, followed by a rolling window of the last bytes written."""
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.head = bytearray()
+        self.tail = bytearray()
+        self.omitted = 0
+
+    def write(self, data: bytes) -> None:
+        room = self.max_bytes - len(self.head)
+        if room > 0:
+            self.head += data[:room]
+            data = data[room:]
+
+        self.tail += data
+        if len(self.tail) > TAIL_BYTES:
+            self.omitted += len(self.tail) - TAIL_BYTES
+            del self.tail[:-TAIL_BYTES]
+
+    def getvalue(self) -> str:
+        """Return the kept bytes as text, marking where bytes were left out."""
+        head = self.head.decode("utf-8", errors="replace")
+        tail = self.tail.decode("utf-8", errors="replace")
+        if self.omitted:
+            return f"{head}\n[... {self.omitted} bytes of output omitted ...]\n{tail}"
+        return head + tail
+
+
+async def read_tio_response(stream: aiohttp.StreamReader, max_bytes: int) -> str:
+    """
+    Read a tio.run response, removing the token that separates its sections.
+
+    The response is stripped chunk by chunk, and at most `max_bytes` plus a fixed tail are
+    held in memory however long the program output is.
+    """
+    try:
+        token = await stream.readexactly(TIO_TOKEN_LENGTH)
+    except asyncio.IncompleteReadError:
+        return ""
+
+    buffer = _CappedBuffer(max_bytes)
+    pending = b""
+    async for chunk in stream.iter_chunked(2 ** 16):
+        data = (pending + chunk).replace(token, b"")
+        # The end of the data may be the start of a token split across chunks
+        keep = min(len(data), TIO_TOKEN_LENGTH - 1)
+        buffer.write(data[: len(data) - keep])
+        pending = data[len(data) - keep :]
+
+    buffer.write(pending)
+    return buffer.getvalue()
+
+
+class EvalOutput(NamedTuple):
+    """The output of an eval job, split from the exit code that ends it."""
 
-                data = await res.read()
-                data = data.decode("utf-8")
-                return data.replace(data[:16], "")  # remove token
+    body: str
+    exit_code: Optional[str]
+    truncated: bool
+
+    @classmethod
+    def parse(cls, result: str, stats: bool) -> "EvalOutput":
+        """
+        Split an eval result into the program output and its exit code.
+
+        The timing stats before the exit code are kept in the output if `stats` is True.
+        Jobs the local backend killed have no exit code, only the truncation message if
+        that's why. Only the end of the result is searched, so this is cheap for long
+        outputs.
+        """
+        body = result.rstrip("\n")
+        truncated = body.endswith(TRUNCATED_ERROR)
+        if truncated:
+            body = body[: -len(TRUNCATED_ERROR)].rstrip("\n")
+
+        exit_code = None
+        index = body.rfind(EXIT_CODE_PREFIX)
+        # The exit code is on the last line of the result, anything else is the output's
+        if index != -1 and "\n" not in body[index:]:
+            exit_code = body[index + len(EXIT_CODE_PREFIX) :].strip()
+            body = body[:index]
+
+        if not stats:
+            start = body.rfind("Real time: ")
+            if start != -1 and body.rstrip("\n").endswith("%"):
+                body = body[:start]
+
+        return cls(body.rstrip("\n"), exit_code, truncated)
+
+
+class PasteService:
+    """
+    Uploads eval outputs to the first paste service that accepts them.
+
+    Every service gets `timeout` seconds, and a circuit breaker skips the ones that keep
+    failing, so a service that is down doesn't slow every upload down. The service is
+    considered unavailable while every circuit is open, or while the last upload took
+    longer than `slow_threshold` seconds, until `reset_timeout` seconds passed.
+    """
+
+    def __init__(
+        self,
+        session: aiohttp.ClientSession,
+        timeout: float,
+        failure_threshold: int,
+        reset_timeout: float,
+        slow_threshold: float,
+    ) -> None:
+        self.session = session
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.reset_timeout = reset_timeout
+        self.slow_threshold = slow_threshold
+        # When the last slow upload finished
+        self._slow_at: Optional[float] = None
+        self.services = (
+            (
+                CircuitBreaker("hastebin", failure_threshold, reset_timeout),
+                self._hastebin,
+            ),
+            (CircuitBreaker("bin", failure_threshold, reset_timeout), self._bin),
+        )
+
+    async def _hastebin(self, text: str) -> Optional[str]:
+        async with self.session.post(
+            f"{HASTEBIN_LINK}/documents", data=text, timeout=self.timeout
+        ) as post:
+            if post.status == 200:
+                response = await post.text()
+                return f"{HASTEBIN_LINK}/{response[8:-2]}.txt"
+
+    async def _bin(self, text: str) -> Optional[str]:
+        async with self.session.post(
+            BIN_LINK, data={"val": text}, timeout=self.timeout
+        ) as post:
+            if post.status == 200:
+                return str(post.url)
+
+    @property
+    def available(self) -> bool:
+        """Whether uploads are expected to succeed quickly."""
+        if all(breaker.is_open for breaker, _ in self.services):
+            return False
+        return (
+            self._slow_at is None or monotonic() - self._slow_at >= self.reset_timeout
+        )
+
+    async def paste(self, text: str) -> Optional[str]:
+        """Upload `text` and return a URL to it, or None if every service failed."""
+        logger.info("Uploading full output to paste service...")
+        start = perf_counter()
+        link = await self._paste(text)
+        if perf_counter() - start > self.slow_threshold:
+            logger.info(f"Uploading took {perf_counter() - start:.1f}s, too long.")
+            self._slow_at = monotonic()
+        else:
+            self._slow_at = None
+        return link
+
+    async def _paste(self, text: str) -> Optional[str]:
+        for breaker, upload in self.services:
+            if breaker.is_open:
+                logger.debug(f"Skipping {breaker.name}, its circuit is open.")
+                continue
+
+            try:
+                link = await upload(text)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"Uploading to {breaker.name} failed: {e!r}")
+                link = None
+
+            if link is None:
+                breaker.record_failure()
+                continue
+
+            breaker.record_success()
+            return link
+        return None
+
+
+def output_file(body: str, gzip_threshold: int) -> File:
+    """
+    Return the complete output as a text file, gzipped if longer than `gzip_threshold`.
+
+    The output is compressed a chunk at a time, so its encoded copy is never held whole.
+    """
+    if len(body) <= gzip_threshold:
+        return File(BytesIO(body.encode("utf-8")), filename="output.txt")
+
+    buffer = BytesIO()
+    with gzip.GzipFile("output.txt", "wb", fileobj=buffer, mtime=0) as file:
+        for start in range(0, len(body), GZIP_CHUNK):
+            file.write(body[start : start + GZIP_CHUNK].encode("utf-8"))
+    buffer.seek(0)
+    return File(buffer, filename="output.txt.gz")
 
 
 class EvalHelper:
     """Eval Helper class."""
 
-    def __init__(self, language: str) -> None:
+    def __init__(self, language: str, session: aiohttp.ClientSession) -> None:
         self.lang = language.strip("`").lower()
+        self.session = session
         self.authorized = (
             "https://hastebin.com",
             "https://gist.github.com",
             "https://gist.githubusercontent.com",
         )
         self.max_file_size = 20000
-        self.truncated_error = "The output exceeded 128 KiB and was truncated."
-        self.hastebin_link = "https://hastebin.com"
-        self.bin_link = "https://bin.drlazor.be/"
+        self.hastebin_link = HASTEBIN_LINK
 
     async def parse(
         self, code: str
@@ -111,7 +328,7 @@ class EvalHelper:
         str, str, str, Dict[Union[str, Any], bool], List[str], List[str], List[str]
     ]:
         """Returned parsed data."""
-        options = {"--stats": False, "--wrapped": False}
+        options = {"--stats": False, "--wrapped": False, "--no-cache": False}
         options_amount = len(options)
 
         # Setting options and removing them from the beginning of the command
@@ -122,7 +339,8 @@ class EvalHelper:
                 options[option] = True
                 i = code.index(option)
                 code.pop(i)
-                code.pop(i)  # Remove following whitespace character
+                if i < len(code):
+                    code.pop(i)  # Remove following whitespace character
         code = "".join(code)
 
         compiler_flags = []
@@ -177,48 +395,24 @@ class EvalHelper:
         url = self.get_raw(base_url)
         print(url)
 
-        async with aiohttp.ClientSession() as client_session:
-            async with client_session.get(url) as response:
-                print(response.status)
-                if response.status == 404:
-                    await ctx.send("Nothing found. Check your link")
-                    logger.info("Exiting | Nothing found in link.")
-                    return
-                elif response.status != 200:
-                    logger.warning(
-                        f"An error occurred | status code: "
-                        f"{response.status} | on request by: {ctx.author}"
-                    )
-                    await ctx.send(
-                        f"An error occurred (status code: {response.status}). "
-                        f"Retry later."
-                    )
-                    return
-                text = await response.text()
-                return text
-
-    async def paste(self, text: str) -> Union[str, dict]:
-        """Upload the eval output to a paste service and return a URL to it if successful."""
-        logger.info("Uploading full output to paste service...")
-        result = dict()
-        text, exit_code = text.split("Exit code: ")
-        if self.truncated_error in exit_code:
-            exit_code = exit_code.replace(self.truncated_error, "")
-        result["exit_code"] = exit_code
-        result["icon"] = ":white_check_mark:" if exit_code == "0" else ":warning:"
-
-        async with aiohttp.ClientSession() as session:
-            post = await session.post(f"{self.hastebin_link}/documents", data=text)
-            if post.status == 200:
-                response = await post.text()
-                result["link"] = f"{self.hastebin_link}/{response[8:-2]}.txt"
-                return result
-
-            # Rollback bin
-            post = await session.post(f"{self.bin_link}", data={"val": text})
-            if post.status == 200:
-                result["link"] = post.url
-                return result
+        async with self.session.get(url) as response:
+            print(response.status)
+            if response.status == 404:
+                await ctx.send("Nothing found. Check your link")
+                logger.info("Exiting | Nothing found in link.")
+                return
+            elif response.status != 200:
+                logger.warning(
+                    f"An error occurred | status code: "
+                    f"{response.status} | on request by: {ctx.author}"
+                )
+                await ctx.send(
+                    f"An error occurred (status code: {response.status}). "
+                    f"Retry later."
+                )
+                return
+            text = await response.text()
+            return text
 
     def get_raw(self, link: str) -> str:
         """Returns the url to raw text version of certain pastebin services."""
@@ -250,15 +444,15 @@ class EvalHelper:
 class FormatOutput:
     """Format Output sent by the Tio.run Api and return embed."""
 
+    GREEN = 0x1F8B4C
+
     def __init__(self, language: str) -> None:
         self.language = language
-        self.GREEN = 0x1F8B4C
         self.max_lines = 11
         self.max_output_length = 500
-        self.eval_helper = EvalHelper(self.language)
 
     @staticmethod
-    def get_icon(exit_code: str) -> str:
+    def get_icon(exit_code: Optional[str]) -> str:
         """Get icon depending on what is the exit code."""
         return ":white_check_mark:" if exit_code == "0" else ":warning:"
 
@@ -271,63 +465,140 @@ class FormatOutput:
         )
         return embed
 
-    def format_hastebin_output(self, output: dict, result: str) -> Embed:
+    def excerpt(self, output: EvalOutput) -> Tuple[str, bool]:
+        """
+        Return the part of the output shown in the embed, and whether some was left out.
+
+        Only the first lines of the output are looked at, however long it is. Lines are
+        numbered when there are several.
+        """
+        body = output.body
+        lines = []
+        start = 0
+        while len(lines) <= self.max_lines:
+            end = body.find("\n", start)
+            if end == -1:
+                lines.append(body[start:])
+                break
+            lines.append(body[start:end])
+            start = end + 1
+
+        if len(lines) > self.max_lines:
+            excerpt = "\n".join(
+                f"{i:02d} | {line}" for i, line in enumerate(lines[: self.max_lines], 1)
+            )
+            excerpt = excerpt[: self.max_output_length] + (
+                "\n... (truncated - too many lines)"
+            )
+            cut = True
+        elif len(body) > self.max_output_length:
+            excerpt = body[: self.max_output_length] + "\n... (truncated - too long)"
+            cut = True
+        elif len(lines) > 1:
+            excerpt = "\n".join(f"{i:02d} | {line}" for i, line in enumerate(lines, 1))
+            cut = output.truncated
+        else:
+            excerpt = body or "[No output]"
+            cut = output.truncated
+
+        zero = "\N{zero width space}"
+        return re.sub("```", f"{zero}`{zero}`{zero}`{zero}", excerpt), cut
+
+    def _description(self, output: EvalOutput) -> str:
+        icon = self.get_icon(output.exit_code)
+        if output.exit_code is None:
+            return f"{icon} Your {self.language} eval job has completed."
+        return (
+            f"{icon} Your {self.language} eval job has completed "
+            f"with return code `{output.exit_code}`."
+        )
+
+    def format_hastebin_output(
+        self,
+        output: EvalOutput,
+        excerpt: str,
+        link: Optional[str],
+        uploading: bool = False,
+        attached: bool = False,
+    ) -> Embed:
         """
         Format Hastebin Output.
 
         Helper function to format output to return embed if the result,
-        is more than 1991 characters or 40 lines.
+        is more than 500 characters or 11 lines.
         """
         logger.info("Formatting hastebin output...")
-        if result.count("\n") > self.max_lines:
-            result = [
-                f"{i:02d} | {line}" for i, line in enumerate(result.split("\n"), 1)
-            ]
-            result = result[: self.max_lines]  # Limiting to only 11 lines
-            program_output = "\n".join(result) + "\n... (truncated - too many lines)"
-
-        elif len(result) > self.max_output_length:
-            program_output = (
-                result[: self.max_output_length] + "\n... (truncated - too long)"
-            )
+        if uploading:
+            complete = "Uploading the complete output..."
+        elif attached:
+            complete = "The complete output is attached."
+        elif link is None:
+            complete = "The complete output couldn't be uploaded."
+        else:
+            complete = f"You can find the complete output [here]({link})"
+        if output.truncated:
+            complete += f"\n{TRUNCATED_ERROR}"
 
         embed = self.embed_helper(
-            description=f"{output['icon']} Your {self.language} eval job has "
-            f"completed with return code `{output['exit_code']}`",
-            field=f"```\n{program_output}```\nYou can find the complete "
-            f"output [here]({output['link']})",
+            description=self._description(output),
+            field=f"```\n{excerpt}```\n{complete}",
         )
 
         logger.info("Output Formatted")
         return embed
 
-    def format_code_output(self, result: str) -> Embed:
+    def format_code_output(self, output: EvalOutput, excerpt: str) -> Embed:
         """
         Format Code Output.
 
         Helper function to format output to return embed if the result
-        is less than 1991 characters or 40 lines.
+        is less than 500 characters or 11 lines.
         """
         logger.info("Formatting message output...")
-
-        zero = "\N{zero width space}"
-        result = re.sub("```", f"{zero}`{zero}`{zero}`{zero}", result)
-        result, exit_code = result.split("Exit code: ")
-        icon = self.get_icon(exit_code)
-        result = result.rstrip("\n")
-        lines = result.count("\n")
-
-        if lines > 0:
-            result = [
-                f"{i:02d} | {line}" for i, line in enumerate(result.split("\n"), 1)
-            ]
-            result = result[: self.max_lines]  # Limiting to only 11 lines
-            result = "\n".join(result)
-
         embed = self.embed_helper(
-            description=f"{icon} Your {self.language} eval job has completed with return code `{exit_code}`.",
-            field=f"```\n{'[No output]' if result == '' else result}```",
+            description=self._description(output),
+            field=f"```\n{excerpt}```",
         )
 
         logger.info("Output Formatted")
         return embed
+
+
+class MultiResult(NamedTuple):
+    """The outcome of one of the jobs of a multi-language eval."""
+
+    language: str
+    output: Optional[EvalOutput]
+    wall_time: float
+    error: Optional[str] = None
+    cached: bool = False
+
+
+def format_multi_output(results: List[MultiResult], total_time: float) -> Embed:
+    """Format the results of a multi-language eval into one embed, a field per job."""
+    embed = Embed(
+        title="Eval Results",
+        colour=FormatOutput.GREEN,
+        description=f"{len(results)} eval jobs completed in {total_time:.2f}s.",
+    )
+    for result in results:
+        if result.output is None:
+            embed.add_field(
+                name=f":x: {result.language}", value=result.error, inline=False
+            )
+            continue
+
+        format_output = FormatOutput(result.language)
+        # Several outputs share the embed, so each gets a shorter excerpt
+        format_output.max_lines = 5
+        format_output.max_output_length = 300
+        excerpt, cut = format_output.excerpt(result.output)
+        name = f"{FormatOutput.get_icon(result.output.exit_code)} {result.language}"
+        if result.output.exit_code is not None:
+            name += f" | exit code {result.output.exit_code}"
+        name += " | cached" if result.cached else f" | {result.wall_time:.2f}s"
+        value = f"```\n{excerpt}```"
+        if cut:
+            value += "\nRun it alone to see the complete output."
+        embed.add_field(name=name, value=value, inline=False)
+    return embed
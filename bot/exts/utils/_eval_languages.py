@@ -0,0 +1,134 @@
+import asyncio
+import bisect
+import difflib
+import json
+from pathlib import Path
+from typing import Dict, FrozenSet, List, Optional
+
+import aiohttp
+from loguru import logger
+
+LANGUAGES_URL = "https://tio.run/languages.json"
+
+
+class LanguageCatalogue:
+    """
+    The languages tio.run supports, along with the aliases users may type for them.
+
+    Aliases from the quick map and the default languages are merged into a single lookup
+    table, and every name is kept sorted for prefix suggestions. The remote list is saved
+    to `cache_path`, so the catalogue is usable at boot before tio.run can be reached, and
+    it is refreshed with conditional requests so an unchanged list isn't downloaded again.
+    """
+
+    def __init__(
+        self, quick_map: Dict[str, str], defaults: Dict[str, str], cache_path: Path
+    ) -> None:
+        # A quick map entry points to a language or to a default, and takes precedence
+        self.aliases = {
+            **defaults,
+            **{alias: defaults.get(name, name) for alias, name in quick_map.items()},
+        }
+        self.cache_path = cache_path
+        self.languages: FrozenSet[str] = frozenset()
+        self.etag: Optional[str] = None
+        self.last_modified: Optional[str] = None
+        self._names: List[str] = sorted(self.aliases)
+
+    def _set_languages(self, languages: FrozenSet[str]) -> None:
+        self.languages = languages
+        self._names = sorted(languages | self.aliases.keys())
+
+    def resolve(self, name: str) -> str:
+        """Return the language `name` is an alias of, or `name` itself."""
+        return self.aliases.get(name, name)
+
+    def suggest(self, name: str, limit: int = 3) -> List[str]:
+        """Return up to `limit` known names starting like `name`, or close to it."""
+        start = bisect.bisect_left(self._names, name)
+        suggestions = []
+        for known in self._names[start:]:
+            if not known.startswith(name) or len(suggestions) == limit:
+                break
+            suggestions.append(known)
+
+        for known in difflib.get_close_matches(name, self._names, n=limit):
+            if known not in suggestions and len(suggestions) < limit:
+                suggestions.append(known)
+        return suggestions
+
+    def __contains__(self, language: str) -> bool:
+        return language in self.languages
+
+    def __len__(self) -> int:
+        return len(self.languages)
+
+    def load(self) -> None:
+        """Load the languages saved by the last refresh, if there are any."""
+        try:
+            saved = json.loads(self.cache_path.read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            logger.info("No saved eval languages, waiting for the first refresh.")
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Couldn't load the saved eval languages: {e!r}")
+            return
+
+        self._set_languages(frozenset(saved["languages"]))
+        self.etag = saved.get("etag")
+        self.last_modified = saved.get("last_modified")
+        logger.info(f"Loaded {len(self)} saved eval languages.")
+
+    def _save(self) -> None:
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.cache_path.with_name(self.cache_path.name + ".tmp")
+        tmp_path.write_text(
+            json.dumps(
+                {
+                    "etag": self.etag,
+                    "last_modified": self.last_modified,
+                    "languages": sorted(self.languages),
+                }
+            ),
+            encoding="utf-8",
+        )
+        tmp_path.replace(self.cache_path)
+
+    async def refresh(self, session: aiohttp.ClientSession) -> bool:
+        """
+        Update the languages from tio.run, returning whether the list changed.
+
+        The saved list is kept if tio.run can't be reached.
+        """
+        headers = {}
+        if self.languages:
+            if self.etag:
+                headers["If-None-Match"] = self.etag
+            if self.last_modified:
+                headers["If-Modified-Since"] = self.last_modified
+
+        try:
+            async with session.get(LANGUAGES_URL, headers=headers) as response:
+                if response.status == 304:
+                    logger.debug("Eval languages are up to date.")
+                    return False
+                if response.status != 200:
+                    logger.warning(
+                        f"Couldn't  reach languages.json (status code: {response.status})."
+                    )
+                    return False
+
+                languages = frozenset(json.loads(await response.text()))
+                self.etag = response.headers.get("ETag")
+                self.last_modified = response.headers.get("Last-Modified")
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+            logger.warning(f"Couldn't refresh the eval languages: {e!r}")
+            return False
+
+        self._set_languages(languages)
+        try:
+            await asyncio.to_thread(self._save)
+        except OSError as e:
+            logger.warning(f"Couldn't save the eval languages: {e!r}")
+        logger.info(f"Updated the eval languages, {len(self)} are supported.")
+        return True
@@ -0,0 +1,224 @@
+import bisect
+from typing import Dict, Iterable, List, Optional, Sequence
+
+import asyncpg
+from asyncpg import Pool, Record
+from loguru import logger
+
+from bot.postgres.utils import db_executemany, db_fetch
+from bot.utils.scheduler import JobTiming
+
+# Upper bounds of the histogram buckets, the last bucket holds everything above them.
+# Saved histograms are summed bucket by bucket, so changing these invalidates them.
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+OUTPUT_BUCKETS_CHARS = (0, 100, 1000, 10000, 100000)
+EXIT_CODE_BUCKETS = ("0", "1", "2-127", "128+", "none")
+# How the requests ended, only completed ones count towards the other histograms
+OUTCOMES = ("completed", "timed out", "backend error", "rejected", "cancelled")
+
+HISTOGRAMS = (
+    "queue_ms",
+    "network_ms",
+    "format_ms",
+    "output_chars",
+    "exit_codes",
+    "outcomes",
+)
+
+UPSERT = """
+INSERT INTO eval_stats
+    (language, requests, pastes, queue_ms, network_ms, format_ms, output_chars, exit_codes,
+    outcomes)
+VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
+ON CONFLICT (language, day) DO UPDATE SET
+    requests = eval_stats.requests + EXCLUDED.requests,
+    pastes = eval_stats.pastes + EXCLUDED.pastes,
+    queue_ms = eval_stats_add(eval_stats.queue_ms, EXCLUDED.queue_ms),
+    network_ms = eval_stats_add(eval_stats.network_ms, EXCLUDED.network_ms),
+    format_ms = eval_stats_add(eval_stats.format_ms, EXCLUDED.format_ms),
+    output_chars = eval_stats_add(eval_stats.output_chars, EXCLUDED.output_chars),
+    exit_codes = eval_stats_add(eval_stats.exit_codes, EXCLUDED.exit_codes),
+    outcomes = eval_stats_add(eval_stats.outcomes, EXCLUDED.outcomes)
+"""
+
+
+def _exit_code_bucket(exit_code: Optional[str]) -> int:
+    if exit_code is None or not exit_code.isdigit():
+        return 4
+    code = int(exit_code)
+    if code < 2:
+        return code
+    return 2 if code < 128 else 3
+
+
+def percentile(histogram: Sequence[int], bounds: Sequence[int], q: float) -> str:
+    """Return the bucket the `q` quantile of `histogram` falls in, as its upper bound."""
+    total = sum(histogram)
+    if not total:
+        return "-"
+    seen = 0
+    for i, count in enumerate(histogram):
+        seen += count
+        if seen >= q * total:
+            break
+    return f"≤{bounds[i]}" if i < len(bounds) else f">{bounds[-1]}"
+
+
+class LanguageStats:
+    """Request counts and histograms of the evals of a language."""
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.pastes = 0
+        self.queue_ms = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.network_ms = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.format_ms = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.output_chars = [0] * (len(OUTPUT_BUCKETS_CHARS) + 1)
+        self.exit_codes = [0] * len(EXIT_CODE_BUCKETS)
+        self.outcomes = [0] * len(OUTCOMES)
+
+    @classmethod
+    def from_record(cls, record: Record) -> "LanguageStats":
+        """Create the stats saved in a row of the eval_stats table."""
+        stats = cls()
+        stats.requests = record["requests"]
+        stats.pastes = record["pastes"]
+        for name in HISTOGRAMS:
+            setattr(stats, name, list(record[name]))
+        return stats
+
+    def merge(self, other: "LanguageStats") -> None:
+        """Add the counts of `other` to these."""
+        self.requests += other.requests
+        self.pastes += other.pastes
+        for name in HISTOGRAMS:
+            histogram = getattr(self, name)
+            for i, count in enumerate(getattr(other, name)):
+                histogram[i] += count
+
+    def as_args(self, language: str) -> tuple:
+        """Return the arguments of the upsert of these stats."""
+        return (
+            language,
+            self.requests,
+            self.pastes,
+            *(getattr(self, name) for name in HISTOGRAMS),
+        )
+
+    def success_rate(self) -> float:
+        """Return the share of the completed evals that exited with 0."""
+        total = sum(self.exit_codes)
+        return self.exit_codes[0] / total if total else 0
+
+
+class EvalStats:
+    """
+    Per-language eval statistics, kept in memory and periodically flushed to Postgres.
+
+    Latencies and output sizes are recorded in fixed histograms, so they take the same
+    space however many evals are run, and saved ones add up across flushes.
+    """
+
+    def __init__(self) -> None:
+        # Recorded since the last flush
+        self.pending: Dict[str, LanguageStats] = {}
+
+    def record(
+        self,
+        language: str,
+        timing: Optional[JobTiming],
+        formatting: Optional[float],
+        output_chars: int,
+        exit_code: Optional[str],
+        pasted: bool = False,
+    ) -> None:
+        """
+        Record a completed eval, with its timings in seconds.
+
+        Cached results have no `timing`, and only count towards the other stats.
+        """
+        stats = self.pending.setdefault(language, LanguageStats())
+        stats.requests += 1
+        stats.pastes += pasted
+        if timing is not None:
+            queue, network = timing
+            stats.queue_ms[bisect.bisect_left(LATENCY_BUCKETS_MS, queue * 1000)] += 1
+            bucket = bisect.bisect_left(LATENCY_BUCKETS_MS, network * 1000)
+            stats.network_ms[bucket] += 1
+        if formatting is not None:
+            bucket = bisect.bisect_left(LATENCY_BUCKETS_MS, formatting * 1000)
+            stats.format_ms[bucket] += 1
+        stats.output_chars[bisect.bisect_left(OUTPUT_BUCKETS_CHARS, output_chars)] += 1
+        stats.exit_codes[_exit_code_bucket(exit_code)] += 1
+        stats.outcomes[0] += 1
+
+    def record_failure(self, language: str, outcome: str) -> None:
+        """Record an eval that didn't complete, with one of the OUTCOMES."""
+        stats = self.pending.setdefault(language, LanguageStats())
+        stats.requests += 1
+        stats.outcomes[OUTCOMES.index(outcome)] += 1
+
+    async def flush(self, pool: Pool) -> None:
+        """Add the pending stats to today's, keeping them for next time on failure."""
+        if not self.pending:
+            return
+
+        pending, self.pending = self.pending, {}
+        try:
+            await db_executemany(
+                pool,
+                UPSERT,
+                [stats.as_args(language) for language, stats in pending.items()],
+            )
+        except (asyncpg.PostgresError, OSError) as e:
+            logger.warning(f"Couldn't flush the eval stats: {e!r}")
+            for language, stats in pending.items():
+                self.pending.setdefault(language, LanguageStats()).merge(stats)
+
+    async def totals(self, pool: Pool, days: int) -> Dict[str, LanguageStats]:
+        """Return the stats of the last `days` days, including the pending ones."""
+        records: Iterable[Record] = await db_fetch(
+            pool,
+            "SELECT * FROM eval_stats WHERE day > CURRENT_DATE - $1::integer",
+            days,
+        )
+        totals: Dict[str, LanguageStats] = {}
+        for record in records:
+            totals.setdefault(record["language"], LanguageStats()).merge(
+                LanguageStats.from_record(record)
+            )
+        for language, stats in self.pending.items():
+            totals.setdefault(language, LanguageStats()).merge(stats)
+        return totals
+
+    @staticmethod
+    def describe(language: str, stats: LanguageStats) -> List[str]:
+        """Return the lines summarising the stats of `language`."""
+
+        def latencies(histogram: List[int]) -> str:
+            return "/".join(
+                percentile(histogram, LATENCY_BUCKETS_MS, q) for q in (0.5, 0.95, 0.99)
+            )
+
+        exit_codes = ", ".join(
+            f"{bucket}: {count}"
+            for bucket, count in zip(EXIT_CODE_BUCKETS, stats.exit_codes)
+            if count
+        )
+        outcomes = ", ".join(
+            f"{outcome}: {count}"
+            for outcome, count in zip(OUTCOMES, stats.outcomes)
+            if count
+        )
+        return [
+            f"**{language}** - {stats.requests} evals, {stats.pastes} pasted, "
+            f"{stats.success_rate():.0%} of the completed exited with 0",
+            f"Outcomes: {outcomes}",
+            f"p50/p95/p99 ms: queue {latencies(stats.queue_ms)}, "
+            f"network {latencies(stats.network_ms)}, "
+            f"format {latencies(stats.format_ms)}",
+            f"Output chars p50/p95: "
+            f"{percentile(stats.output_chars, OUTPUT_BUCKETS_CHARS, 0.5)}/"
+            f"{percentile(stats.output_chars, OUTPUT_BUCKETS_CHARS, 0.95)}, "
+            f"exit codes {exit_codes}",
+        ]
@@ -7,6 +7,7 @@ from disnake.ext import commands
 
 from bot.bot import Bot
 from bot.constants import Colours
+from bot.utils.cache import CacheStats
 
 
 class BotStats(commands.Cog):
@@ -25,6 +26,13 @@ class BotStats(commands.Cog):
         )
         await ctx.send(content=ctx.author.mention, embed=embed)
 
+    @staticmethod
+    def _describe_cache(stats: CacheStats) -> str:
+        return (
+            f"{stats.hits} hits, {stats.misses} misses ({stats.hit_rate:.0%} hit rate), "
+            f"{stats.evictions} evicted"
+        )
+
     @commands.command()
     async def stats(self, ctx: commands.Context) -> None:
         """Get the information and current uptime of the bot."""
@@ -39,10 +47,63 @@ class BotStats(commands.Cog):
             datetime.utcnow().timestamp() - self.bot.launch_time
         )
 
+        render_service = self.bot.render_service
+        render_queue = (
+            f"{render_service.running} running, {render_service.queue_depth} queued"
+        )
+        if timings := render_service.timings:
+            average_wait = sum(timing.wait for timing in timings) / len(timings)
+            average_run = sum(timing.run for timing in timings) / len(timings)
+            render_queue += (
+                f"\nLast {len(timings)} jobs: {average_wait:.2f}s waiting, "
+                f"{average_run:.2f}s rendering on average"
+            )
+
+        bonk_template = "Not pre-warmed"
+        if (bonk := self.bot.get_cog("Bonk")) and bonk.template_workers:
+            nbytes = bonk.template_workers.values()
+            bonk_template = (
+                f"Loaded in {len(nbytes)}/{render_service.workers} render workers, "
+                f"{humanize.naturalsize(sum(nbytes), binary=True)} in total"
+            )
+
+        bonk_cache = "Not loaded"
+        if bonk:
+            bonk_cache = f"Memory: {self._describe_cache(bonk.cache.stats)}"
+            if bonk.disk_cache is not None:
+                bonk_cache += f"\nDisk: {self._describe_cache(bonk.disk_cache.stats)}"
+
+        eval_scheduler = self.bot.eval_scheduler
+        eval_queue = (
+            f"{eval_scheduler.running} running, {eval_scheduler.queue_depth} queued, "
+            f"{eval_scheduler.jobs_rejected} rejected, "
+            f"{eval_scheduler.jobs_timed_out} timed out, "
+            f"{eval_scheduler.jobs_cancelled} cancelled"
+        )
+        if timings := eval_scheduler.timings:
+            average_wait = sum(timing.wait for timing in timings) / len(timings)
+            average_run = sum(timing.run for timing in timings) / len(timings)
+            eval_queue += (
+                f"\nLast {len(timings)} jobs: {average_wait:.2f}s waiting, "
+                f"{average_run:.2f}s running on average"
+            )
+
+        http_stats = self.bot.eval_http_stats
+        eval_http = (
+            f"{http_stats.requests} requests, "
+            f"{http_stats.connections_reused} connections reused, "
+            f"{http_stats.connections_created} opened"
+        )
+
         fields = {
             "Python version": python_version(),
             "Disnake version": __version__,
             "Uptime": uptime,
+            "Render queue": render_queue,
+            "Bonk template": bonk_template,
+            "Bonk cache": bonk_cache,
+            "Eval queue": eval_queue,
+            "Eval HTTP": eval_http,
         }
 
         for name, value in list(fields.items()):
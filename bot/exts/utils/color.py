@@ -1,17 +1,29 @@
 from io import BytesIO
 from string import hexdigits
+from typing import List, Tuple
 
 from disnake import File
-from disnake.ext.commands import Cog, Context, command
-from PIL import Image
+from disnake.ext.commands import Cog, Context, group
+from PIL import Image, ImageColor
 
 from bot.bot import Bot
+from bot.constants import Images
+from bot.utils.cache import LRUCache
+from bot.utils.render import RenderQueueFull
+
+RGB = Tuple[int, int, int]
 
 
 class Color(Cog):
     """A cog containing a parser function for parsing the colors and the command function."""
 
     IMAGE_SIZE = (128, 128)
+    MAX_PALETTE_COLORS = 16
+
+    def __init__(self, bot: Bot) -> None:
+        self.bot = bot
+        # Rendered PNGs keyed by the RGB values of their swatches
+        self.cache = LRUCache(Images.color_cache_max_bytes)
 
     @staticmethod
     def parse_color(color_code: str) -> str:
@@ -33,7 +45,39 @@ class Color(Cog):
 
         return color_code
 
-    @command(
+    @staticmethod
+    def normalize_color(color_code: str) -> RGB:
+        """
+        Return the RGB value of a parsed color code, raising ValueError if it is unknown.
+
+        Every spelling of a color normalizes to the same value, and the swatches are opaque,
+        so any alpha is dropped.
+        """
+        return ImageColor.getcolor(color_code, "RGB")
+
+    @staticmethod
+    def render_swatches(colors: Tuple[RGB, ...], size: Tuple[int, int]) -> bytes:
+        """Render a PNG strip of `size` swatches, one per color, from left to right."""
+        width, height = size
+        # One pixel per color, scaled up in a single pass
+        strip = Image.frombytes(
+            "RGB", (len(colors), 1), bytes(value for rgb in colors for value in rgb)
+        ).resize((width * len(colors), height), Image.Resampling.NEAREST)
+
+        bufferio = BytesIO()
+        strip.save(bufferio, format="PNG")
+        return bufferio.getvalue()
+
+    async def get_swatches(self, colors: Tuple[RGB, ...]) -> bytes:
+        """Return the swatches of `colors`, rendering them if they aren't cached."""
+        if (image := self.cache.get(colors)) is None:
+            image = await self.bot.render_service.submit(
+                self.render_swatches, colors, self.IMAGE_SIZE
+            )
+            self.cache.set(colors, image)
+        return image
+
+    @group(
         help="""color <color value>
             Get a visual picture for color given as input, valid formats are -
 
@@ -46,24 +90,67 @@ class Color(Cog):
         brief="Get a image of the color given as input",
         name="color",
         aliases=("col",),
+        invoke_without_command=True,
     )
     async def color_command(self, ctx: Context, *, color_code: str) -> None:
         """Sends an image which is the color of provided as the input."""
         parsed_color_code = self.parse_color(color_code)
 
         try:
-            new_col = Image.new("RGB", self.IMAGE_SIZE, parsed_color_code)
+            image = await self.get_swatches((self.normalize_color(parsed_color_code),))
         except ValueError:
             await ctx.send(f"Unknown color specifier `{color_code}`")
             return
-        bufferio = BytesIO()
-        new_col.save(bufferio, format="PNG")
-        bufferio.seek(0)
+        except RenderQueueFull:
+            await ctx.send(
+                "Too many images are being rendered right now, try again later."
+            )
+            return
 
-        file = File(bufferio, filename=f"{parsed_color_code}.png")
+        file = File(BytesIO(image), filename=f"{parsed_color_code}.png")
 
         await ctx.send(file=file)
 
+    @color_command.command(
+        help="""color palette <color values>
+            Get a single picture of several colors side by side.
+
+            Colors are separated by spaces, or by semicolons when they contain spaces -
+                color palette #181818 #ffb86c 0x50fa7b
+                color palette rgb(24, 24, 24); 255, 184, 108
+            """,
+        brief="Get a image of several colors given as input",
+        name="palette",
+        aliases=("p",),
+    )
+    async def palette_command(self, ctx: Context, *, color_codes: str) -> None:
+        """Sends a single image of every color provided as the input, side by side."""
+        separator = ";" if ";" in color_codes else None
+        codes = [code.strip() for code in color_codes.split(separator) if code.strip()]
+        if not 0 < len(codes) <= self.MAX_PALETTE_COLORS:
+            await ctx.send(
+                f"A palette needs between 1 and {self.MAX_PALETTE_COLORS} colors."
+            )
+            return
+
+        colors: List[RGB] = []
+        for code in codes:
+            try:
+                colors.append(self.normalize_color(self.parse_color(code)))
+            except ValueError:
+                await ctx.send(f"Unknown color specifier `{code}`")
+                return
+
+        try:
+            image = await self.get_swatches(tuple(colors))
+        except RenderQueueFull:
+            await ctx.send(
+                "Too many images are being rendered right now, try again later."
+            )
+            return
+
+        await ctx.send(file=File(BytesIO(image), filename="palette.png"))
+
 
 def setup(bot: Bot) -> None:
     """Load the Color cog."""
@@ -9,21 +9,30 @@
 
 # The above copyright notice and this permission notice shall be included in all
 # copies or substantial portions of the Software.
+import asyncio
 import contextlib
 import inspect
 import pprint
 import re
 import textwrap
+import time
 import traceback
-from io import StringIO
-from typing import Any, Optional, Tuple
+from collections import defaultdict
+from io import BytesIO, StringIO
+from typing import Any, Dict, List, Optional, Tuple
 
 import disnake
+import humanize
 from disnake.ext.commands import Cog, Context, group, has_any_role, is_owner
 from loguru import logger
 
 from bot.bot import Bot
-from bot.constants import ENVIRONMENT, Roles
+from bot.constants import ENVIRONMENT, Colours, Roles
+from bot.utils.loop_monitor import awaited_name, task_name
+from bot.utils.pagination import LinePaginator
+from bot.utils.profiling import DeterministicProfiler, Profiler, SamplingProfiler
+
+LAG_QUANTILES = (0.5, 0.9, 0.99, 1)
 
 
 def find_nth_occurrence(string: str, substring: str, n: int) -> Optional[int]:
@@ -47,6 +56,25 @@ class DevOps(Cog):
 
         if ENVIRONMENT != "production":
             self.eval.add_check(is_owner().predicate)
+            self.profile.add_check(is_owner().predicate)
+
+    @staticmethod
+    def _clean_code(code: str) -> str:
+        """Strip the code block around `code`, and assign it to `_` if an expression."""
+        code = code.strip("`")
+        if re.match("py(thon)?\n", code):
+            code = "\n".join(code.split("\n")[1:])
+
+        if (
+            not re.search(  # Check if it's an expression
+                r"^(return|import|for|while|def|class|" r"from|exit|[a-zA-Z0-9]+\s*=)",
+                code,
+                re.M,
+            )
+            and len(code.split("\n")) == 1
+        ):
+            code = "_ = " + code
+        return code
 
     def _format(self, inp: str, out: Any) -> Tuple[str, Optional[disnake.Embed]]:
         """Format the eval output into a string & attempt to format it into an Embed."""
@@ -156,6 +184,17 @@ class DevOps(Cog):
             self.env = {}
             return await ctx.send("```Reset history!```")
 
+        self._update_env(ctx)
+
+        try:
+            res = await self._run(code)
+        except Exception:
+            res = traceback.format_exc()
+
+        await self._send_output(ctx, code, res)
+
+    def _update_env(self, ctx: Context) -> None:
+        """Make the objects of the invocation available to the evaluated code."""
         env = {
             "message": ctx.message,
             "author": ctx.message.author,
@@ -172,6 +211,8 @@ class DevOps(Cog):
 
         self.env.update(env)
 
+    async def _run(self, code: str) -> Any:
+        """Run the code in the eval environment and return its result."""
         # Ignore this code, it works
         code_ = """
 async def func():  # (None,) -> Any
@@ -188,14 +229,14 @@ async def func():  # (None,) -> Any
             textwrap.indent(code, "            ")
         )
 
-        try:
-            exec(code_, self.env)  # noqa: B102,S102
-            func = self.env["func"]
-            res = await func()
-
-        except Exception:
-            res = traceback.format_exc()
+        exec(code_, self.env)  # noqa: B102,S102
+        func = self.env["func"]
+        return await func()
 
+    async def _send_output(
+        self, ctx: Context, code: str, res: Any, file: Optional[disnake.File] = None
+    ) -> None:
+        """Send the output of the eval of `code`, and `file` if there is one."""
         out, embed = self._format(code, res)
         out = out.rstrip("\n")  # Strip empty lines from output
 
@@ -208,15 +249,18 @@ async def func():  # (None,) -> Any
             truncate_index = newline_truncate_index
 
         if len(out) > truncate_index:
+            files = [disnake.File(fp=StringIO(out), filename="out.txt")]
+            if file:
+                files.append(file)
             await ctx.send(
                 f"```py\n{out[:truncate_index]}\n```"
                 f"... response truncated; full output uploaded as an attachment",
                 embed=embed,
-                file=disnake.File(fp=StringIO(out), filename="out.txt"),
+                files=files,
             )
             return
 
-        await ctx.send(f"```py\n{out}```", embed=embed)
+        await ctx.send(f"```py\n{out}```", embed=embed, file=file)
 
     @group(name="devops")
     @has_any_role(Roles.devops, Roles.steering_council)
@@ -228,21 +272,131 @@ async def func():  # (None,) -> Any
     @devops_group.command(name="eval", aliases=("e",))
     async def eval(self, ctx: Context, *, code: str) -> None:
         """Run eval in a REPL-like format."""
-        code = code.strip("`")
-        if re.match("py(thon)?\n", code):
-            code = "\n".join(code.split("\n")[1:])
+        await self._eval(ctx, self._clean_code(code))
+
+    @devops_group.command(name="profile", aliases=("p",))
+    async def profile(self, ctx: Context, *, code: str) -> None:
+        """
+        Run code like eval, under a profiler, and show where the time was spent.
+
+        Options go before the code:
+        --sampling  samples the stack instead of recording every call
+        --interval <ms>  time between samples, 5 by default
+        --top <n>  functions listed, 10 by default
+
+        Everything the event loop runs meanwhile is profiled too. The complete profile
+        is attached, as a pstats file or as collapsed stacks for flame graphs.
+        """
+        options = {"--sampling": False, "--interval": 5.0, "--top": 10}
+        while (match := re.match(r"(--\w+)\s+", code)) and match[1] in options:
+            option = match[1]
+            code = code[match.end() :]
+            if option == "--sampling":
+                options[option] = True
+                continue
+
+            value = re.match(r"(\S*)\s*", code)
+            code = code[value.end() :]
+            try:
+                options[option] = type(options[option])(value[1])
+            except ValueError:
+                await ctx.send(f"`{option}` takes a number.")
+                return
+        code = self._clean_code(code)
+
+        profiler: Profiler
+        if options["--sampling"]:
+            profiler = SamplingProfiler(max(options["--interval"], 0.1) / 1000)
+        else:
+            profiler = DeterministicProfiler()
 
-        if (
-            not re.search(  # Check if it's an expression
-                r"^(return|import|for|while|def|class|" r"from|exit|[a-zA-Z0-9]+\s*=)",
-                code,
-                re.M,
-            )
-            and len(code.split("\n")) == 1
+        logger.info(f"Profiling the following snippet:\n{code}")
+        self.ln += 1
+        self._update_env(ctx)
+        try:
+            with profiler:
+                res = await self._run(code)
+        except Exception:
+            res = traceback.format_exc()
+
+        cumulative, own = profiler.top(max(options["--top"], 1))
+        report = [
+            self._ranking(f"Cumulative {profiler.unit}", cumulative),
+            self._ranking(f"Self {profiler.unit}", own),
+        ]
+        filename, data = profiler.dump()
+        await self._send_output(ctx, code, res, disnake.File(BytesIO(data), filename))
+        await ctx.send("\n".join(report)[:2000])
+
+    @devops_group.command(name="tasks", aliases=("t",))
+    async def tasks(self, ctx: Context) -> None:
+        """List the running asyncio tasks, grouped by coroutine and what they await."""
+        monitor = self.bot.loop_monitor
+        groups: Dict[Tuple[str, Optional[str]], List[Optional[float]]] = defaultdict(
+            list
+        )
+        all_tasks = asyncio.all_tasks()
+        for task in all_tasks:
+            groups[task_name(task), awaited_name(task)].append(monitor.age(task))
+
+        lines = []
+        for (name, awaited), ages in sorted(
+            groups.items(), key=lambda item: (-len(item[1]), item[0][0])
         ):
-            code = "_ = " + code
+            line = f"**{len(ages)}×** `{name}`"
+            if awaited is not None:
+                line += f" awaiting `{awaited}`"
+            known = [age for age in ages if age is not None]
+            if known:
+                line += f"\nOldest {humanize.naturaldelta(max(known))}"
+                if len(known) > 1:
+                    line += f", newest {humanize.naturaldelta(min(known))}"
+            lines.append(line)
+
+        embed = disnake.Embed(
+            title=f"{len(all_tasks)} running tasks", colour=Colours.green
+        )
+        await LinePaginator.paginate(
+            lines, ctx, embed, max_lines=10, max_size=2000, allow_empty_lines=True
+        )
+
+    @devops_group.command(name="loop", aliases=("l",))
+    async def loop(self, ctx: Context, slowest: int = 20) -> None:
+        """Show the recent event loop lag, and the `slowest` task steps recorded recently."""
+        monitor = self.bot.loop_monitor
+        percentiles = monitor.lag_percentiles(LAG_QUANTILES)
+        if percentiles is None:
+            lines = ["No lag measured yet."]
+        else:
+            lag = "/".join(f"{value * 1000:.1f}" for value in percentiles)
+            lines = [
+                f"**Lag** p50/p90/p99/max over the last {len(monitor.lags)} "
+                f"measures: {lag}ms",
+            ]
+
+        lines.append(
+            f"\n**Slowest task steps** over {monitor.slow_step_duration * 1000:.0f}ms"
+        )
+        steps = monitor.slowest_steps(max(slowest, 1))
+        now = time.monotonic()
+        for step in steps:
+            lines.append(
+                f"`{step.duration * 1000:>7.1f}ms` `{step.name[:70]}` "
+                f"{humanize.naturaldelta(now - step.at)} ago"
+            )
+        if not steps:
+            lines.append("None recorded recently.")
+
+        embed = disnake.Embed(title="Event loop", colour=Colours.green)
+        await LinePaginator.paginate(
+            lines, ctx, embed, max_lines=15, max_size=2000, allow_empty_lines=True
+        )
 
-        await self._eval(ctx, code)
+    @staticmethod
+    def _ranking(title: str, ranking: list) -> str:
+        """Format a ranking of functions as a code block."""
+        lines = [f"{value:>10.4g}  {name[:70]}" for name, value in ranking]
+        return f"**{title}**\n```\n" + ("\n".join(lines) or "Nothing recorded") + "```"
 
 
 def setup(bot: Bot) -> None:
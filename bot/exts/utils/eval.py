@@ -1,56 +1,369 @@
-import datetime
-import json
+import asyncio
+import re
+from contextlib import suppress
 from pathlib import Path
-from typing import Optional
+from time import perf_counter
+from typing import Awaitable, Dict, Optional, Tuple, TypeVar
 
-import aiohttp
-from disnake import Embed, Message
+from disnake import Embed, File, HTTPException, Message
 from disnake.ext import commands, tasks
-from disnake.ext.commands import Cog, Context, command
+from disnake.ext.commands import Cog, Context, group
 from disnake.utils import escape_mentions
 from loguru import logger
 from yaml import safe_load
 
 from bot.bot import Bot
+from bot.constants import Emojis, Evals
+from bot.utils.cache import LRUCache
+from bot.utils.pagination import LinePaginator
+from bot.utils.scheduler import JobTiming, PositionCallback, SchedulerQueueFull
 
-from ._eval_helper import EvalHelper, FormatOutput, Tio
+from ._eval_backends import (
+    EvalBackendError,
+    EvalJob,
+    EvalResult,
+    EvalRouter,
+    LocalBackend,
+    SandboxLimits,
+    TioBackend,
+)
+from ._eval_helper import (
+    EvalHelper,
+    EvalOutput,
+    FormatOutput,
+    MultiResult,
+    PasteService,
+    format_multi_output,
+    output_file,
+)
+from ._eval_languages import LanguageCatalogue
+from ._eval_stats import EvalStats
 
 SOFT_RED = 0xCD6D6D
 GREEN = 0x1F8B4C
+CACHED_FOOTER = "This is a cached result, add --no-cache to run the code again."
+# A fenced code block with a language tag
+CODE_BLOCK = re.compile(r"```([^\s`]+)\n(.*?)```", re.DOTALL)
+# Seconds before the cancel reaction is added, so quick evals don't get it at all
+CANCEL_DELAY = 2
+CANCEL_EMOJI = Emojis.CROSS_MARK_EMOJI
+
+# Seconds without further edits before an edited eval is run again
+EDIT_DEBOUNCE = 1.5
+# Eval messages whose response is kept, so the response can be edited when they are
+MAX_TRACKED_EVALS = 500
+
+T = TypeVar("T")
+
+
+class EvalCancelled(Exception):
+    """Raised when the author cancelled their eval."""
+
+    pass
 
 
 class Eval(Cog):
-    """Safe evaluation of Code using Tio Run Api."""
+    """Safe evaluation of Code using Tio Run Api, or a local sandbox."""
 
     def __init__(self, bot: Bot) -> None:
+        if Evals.multi_max_jobs > Evals.max_queue:
+            # When every slot is taken, all the blocks of a multi eval have to be queued
+            raise ValueError(
+                f"EVAL_MULTI_MAX_JOBS ({Evals.multi_max_jobs}) can't be more than "
+                f"EVAL_MAX_QUEUE ({Evals.max_queue})."
+            )
+
         self.bot = bot
         with Path("bot/resources/eval/default_langs.yml").open(encoding="utf8") as file:
-            self.default_languages = safe_load(file)
-        self.languages_url = "https://tio.run/languages.json"
+            default_languages = safe_load(file)
+        with Path("bot/resources/eval/quick_map.yml").open(encoding="utf8") as file:
+            quick_map = safe_load(file)
+        self.languages = LanguageCatalogue(
+            quick_map, default_languages, Evals.languages_cache
+        )
+        self.languages.load()
+
+        self.tio = TioBackend(bot.eval_session, self.languages, Evals.max_output_bytes)
+        backends = [self.tio]
+        if Evals.local_backend:
+            local = LocalBackend.from_config(
+                Path("bot/resources/eval/local_langs.yml"),
+                SandboxLimits(
+                    Evals.local_cpu_seconds,
+                    Evals.local_wall_seconds,
+                    Evals.local_memory_bytes,
+                    Evals.local_max_processes,
+                ),
+                Evals.local_uid,
+                Evals.local_gid,
+            )
+            if local is not None:
+                # Local languages skip the round trip, and fall back to tio.run on failure
+                backends.insert(0, local)
+        self.router = EvalRouter(
+            backends,
+            LRUCache(
+                Evals.cache_max_bytes,
+                sizeof=lambda result: len(result.output),
+                ttl=Evals.cache_ttl,
+            ),
+        )
+
+        self.paste_service = PasteService(
+            bot.eval_session,
+            Evals.paste_timeout,
+            Evals.paste_failure_threshold,
+            Evals.paste_reset_timeout,
+            Evals.paste_slow_seconds,
+        )
+        # Uploads still running after their result was sent, by eval message
+        self._paste_tasks: Dict[int, asyncio.Task] = {}
+        # Responses of recent evals, edited when their message is, by eval message
+        self.responses = LRUCache(
+            MAX_TRACKED_EVALS, sizeof=lambda _: 1, ttl=Evals.rerun_window
+        )
+        # Evals running, and reruns waiting for edits to settle, by eval message
+        self._running: Dict[int, asyncio.Task] = {}
+        self._reruns: Dict[int, asyncio.Task] = {}
+
+        self.stats = EvalStats()
+        self.flush_stats.start()
+
         self.update_languages.start()
         with Path("bot/resources/eval/wrapping.yml").open(encoding="utf8") as file:
             self.wrapping = safe_load(file)
-        with Path("bot/resources/eval/quick_map.yml").open(encoding="utf8") as file:
-            self.quick_map = safe_load(file)
 
     @tasks.loop(hours=5)
     async def update_languages(self) -> None:
         """Update list of languages supported by api every 5 hour."""
         logger.info("Updating List Of Languages")
-        async with aiohttp.ClientSession() as client_session:
-            async with client_session.get(self.languages_url) as response:
-                if response.status != 200:
-                    logger.warning(
-                        f"Couldn't  reach languages.json (status code: {response.status})."
-                    )
-                languages = tuple(sorted(json.loads(await response.text())))
-                self.languages = languages
-        logger.info(
-            f"Successfully Updated List Of Languages To Date: {datetime.datetime.now()}"
+        await self.languages.refresh(self.bot.eval_session)
+        logger.debug(f"Eval HTTP: {self.bot.eval_http_stats!r}")
+
+    @tasks.loop(minutes=Evals.stats_flush_minutes)
+    async def flush_stats(self) -> None:
+        """Save the eval stats recorded since the last flush."""
+        await self.stats.flush(self.bot.db_pool)
+
+    @flush_stats.after_loop
+    async def flush_remaining_stats(self) -> None:
+        """Save the stats recorded since the last flush when the cog is unloaded."""
+        if self.flush_stats.is_being_cancelled():
+            await self.stats.flush(self.bot.db_pool)
+
+    def cog_unload(self) -> None:
+        """
+        Cancel the paste uploads, reruns and language updates that are pending.
+
+        The stats recorded since the last flush are flushed.
+        """
+        for task in (*self._paste_tasks.values(), *self._reruns.values()):
+            task.cancel()
+        self.update_languages.cancel()
+        self.flush_stats.cancel()
+
+    @staticmethod
+    def _track(
+        in_flight: Dict[int, asyncio.Task], key: int, task: asyncio.Task
+    ) -> None:
+        """Keep `task` in `in_flight` under `key` until it is done."""
+
+        def forget(_: asyncio.Task) -> None:
+            if in_flight.get(key) is task:
+                del in_flight[key]
+
+        in_flight[key] = task
+        task.add_done_callback(forget)
+
+    async def cog_before_invoke(self, ctx: Context) -> None:
+        """Keep track of the running eval, so an edit of its message can cancel it."""
+        # Stats are paginated for a while and aren't worth rerunning on edits
+        if ctx.command is self.eval_stats:
+            return
+        self._running[ctx.message.id] = asyncio.current_task()
+
+    async def cog_after_invoke(self, ctx: Context) -> None:
+        """Forget the eval that finished, unless a rerun already replaced it."""
+        if self._running.get(ctx.message.id) is asyncio.current_task():
+            del self._running[ctx.message.id]
+
+    async def reply(
+        self,
+        ctx: Context,
+        content: Optional[str] = None,
+        *,
+        embed: Optional[Embed] = None,
+        file: Optional[File] = None,
+    ) -> Message:
+        """Send the response of an eval, or edit it in if the eval was edited and rerun."""
+        response = self.responses.get(ctx.message.id)
+        if response is not None:
+            # Replace the attachments of the previous response too
+            files = {"file": file} if file else {}
+            try:
+                await response.edit(
+                    content=content, embed=embed, attachments=[], **files
+                )
+                return response
+            except HTTPException:
+                logger.debug("The previous eval response is gone, sending a new one.")
+                if file:
+                    file.reset()
+
+        response = await ctx.send(content, embed=embed, file=file)
+        self.responses.set(ctx.message.id, response)
+        return response
+
+    @Cog.listener()
+    async def on_message_edit(self, before: Message, after: Message) -> None:
+        """Run an eval again once its message is edited, debouncing rapid edits."""
+        if before.content == after.content:
+            return
+        if after.id not in self._running and after.id not in self.responses:
+            return
+
+        if (rerun := self._reruns.get(after.id)) is not None:
+            rerun.cancel()
+        self._track(self._reruns, after.id, asyncio.create_task(self._rerun(after)))
+
+    async def _rerun(self, message: Message) -> None:
+        await asyncio.sleep(EDIT_DEBOUNCE)
+
+        # The previous run and its upload would only overwrite the new response
+        for in_flight in (self._running, self._paste_tasks):
+            if (task := in_flight.pop(message.id, None)) is not None:
+                task.cancel()
+
+        ctx = await self.bot.get_context(message)
+        if ctx.command is not self.eval_command:
+            return
+        logger.info(f"Rerunning the eval of {message.author}, as they edited it.")
+        await self.bot.invoke(ctx)
+
+    async def add_paste_link(
+        self,
+        message: Message,
+        output: EvalOutput,
+        format_output: FormatOutput,
+        excerpt: str,
+        footer: Optional[str],
+    ) -> None:
+        """
+        Upload the complete `output` and edit the link to it into `message`.
+
+        The output is attached to the message instead if it couldn't be uploaded.
+        """
+        link = await self.paste_service.paste(output.body)
+        files = {}
+        if link is None:
+            files["file"] = output_file(output.body, Evals.attachment_gzip_threshold)
+        embed = format_output.format_hastebin_output(
+            output, excerpt, link, attached=link is None
         )
+        if footer:
+            embed.set_footer(text=footer)
+        try:
+            await message.edit(embed=embed, **files)
+        except HTTPException as e:
+            # The result may have been deleted in the meantime
+            logger.debug(f"Couldn't add the paste link to the eval result: {e!r}")
+
+    def language_error(self, ctx: Context, lang: str) -> Embed:
+        """Return an embed telling `lang` isn't supported, with the closest languages."""
+        suggestions = ", ".join(f"`{name}`" for name in self.languages.suggest(lang))
+        did_you_mean = f"Did you mean {suggestions}?\n" if suggestions else ""
+        return Embed(
+            title="Language Not Supported",
+            description=f"Your language was invalid: {lang}\n{did_you_mean}"
+            f"All Supported languages: [here](https://tio.run)\n\nUsage:\n"
+            f"```{ctx.prefix}{ctx.command} {ctx.command.signature}```",
+            color=SOFT_RED,
+        )
+
+    async def run_job(
+        self,
+        ctx: Context,
+        job: EvalJob,
+        use_cache: bool,
+        on_position: Optional[PositionCallback] = None,
+        group: Optional[int] = None,
+    ) -> Tuple[EvalResult, Optional[JobTiming]]:
+        """
+        Run `job` once a slot is free for the author, unless its result is cached.
+
+        Jobs of the same `group` take a single place of the author's share of the queue.
+
+        Return the result, and the time spent queued and running unless it was cached.
+        SchedulerQueueFull and EvalBackendError are raised if it couldn't run, and
+        asyncio.TimeoutError if it ran past the deadline.
+        """
+        # Cached results don't need to wait for a slot
+        if use_cache and (eval_result := self.router.cached(job)) is not None:
+            return eval_result, None
+
+        submitted_at = perf_counter()
+        started_at = None
 
-    @command(
-        help="""eval <language> [--wrapped] [--stats] <code>
+        async def run() -> EvalResult:
+            nonlocal started_at
+            started_at = perf_counter()
+            return await self.router.run(job, use_cache)
+
+        eval_result = await self.bot.eval_scheduler.submit(
+            ctx.author.id,
+            run,
+            on_position=on_position,
+            timeout=Evals.job_timeout,
+            group=group,
+        )
+        timing = JobTiming(started_at - submitted_at, perf_counter() - started_at)
+        return eval_result, timing
+
+    async def _offer_cancel(self, ctx: Context, job: asyncio.Future) -> bool:
+        """Cancel `job` if the author reacts to their message with the cancel emoji."""
+        await asyncio.sleep(CANCEL_DELAY)
+        try:
+            await ctx.message.add_reaction(CANCEL_EMOJI)
+        except HTTPException:
+            # Reactions may not be allowed here, the eval just can't be cancelled then
+            return False
+
+        try:
+            await self.bot.wait_for(
+                "reaction_add",
+                check=lambda reaction, user: (
+                    reaction.message.id == ctx.message.id
+                    and user.id == ctx.author.id
+                    and str(reaction.emoji) == CANCEL_EMOJI
+                ),
+            )
+        finally:
+            with suppress(HTTPException):
+                await ctx.message.remove_reaction(CANCEL_EMOJI, self.bot.user)
+
+        job.cancel()
+        logger.info(f"{ctx.author} cancelled their eval.")
+        return True
+
+    async def run_cancellable(self, ctx: Context, awaitable: Awaitable[T]) -> T:
+        """
+        Await `awaitable`, which the author can cancel by reacting to their message.
+
+        EvalCancelled is raised if they did, and everything `awaitable` held is freed.
+        """
+        job = asyncio.ensure_future(awaitable)
+        offer = asyncio.create_task(self._offer_cancel(ctx, job))
+        try:
+            return await job
+        except asyncio.CancelledError:
+            if offer.done() and not offer.cancelled() and offer.result():
+                raise EvalCancelled from None
+            raise
+        finally:
+            offer.cancel()
+
+    @group(
+        help=f"""eval <language> [--wrapped] [--stats] [--no-cache] <code>
 
             for command-line-options, compiler-flags and arguments you may
             add a line starting with this argument, and after a space add
@@ -58,6 +371,7 @@ class Eval(Cog):
 
             stats  - option displays more information on execution consumption
             wrapped  - allows you to not put main function in some languages
+            no-cache  - runs the code again even if the same code was run recently
 
             <code> may be normal code, but also an attached file, or a link from  \
             [hastebin](https://hastebin.com) or [Github gist](https://gist.github.com)
@@ -66,11 +380,17 @@ class Eval(Cog):
             for instance : `!eval python link=https://hastebin.com/gurkbot.py`
 
             If the output exceeds 40 lines or Discord max message length, it will be put
-            in a new hastebin and the link will be returned.
+            in a new hastebin and the link will be returned, or attached to the response
+            while paste services are down.
+
+            Evals are stopped after {Evals.job_timeout} seconds, and you can cancel one
+            earlier by reacting to your message with {CANCEL_EMOJI}.
+            Editing your message runs it again, and updates the response in place.
             """,
         brief="Execute code in a given programming language",
         name="eval",
         aliases=("e",),
+        invoke_without_command=True,
     )
     @commands.cooldown(3, 10, commands.BucketType.user)
     async def eval_command(
@@ -82,7 +402,7 @@ class Eval(Cog):
         Return the bot response.
         """
         async with ctx.typing():
-            eval_helper = EvalHelper(language)
+            eval_helper = EvalHelper(language, self.bot.eval_session)
 
             parsed_data = await eval_helper.parse(code)
             (
@@ -118,11 +438,8 @@ class Eval(Cog):
                 # Ensures code isn't empty after removing options
                 raise commands.MissingRequiredArgument(ctx.command.clean_params["code"])
 
-            if lang in self.quick_map:
-                lang = self.quick_map[lang]
-            if lang in self.default_languages:
-                lang = self.default_languages[lang]
-            if lang not in self.languages:
+            lang = self.languages.resolve(lang)
+            if not self.router.supports(lang):
                 if not escape_mentions(lang):
                     embed = Embed(
                         title="MissingRequiredArgument",
@@ -131,14 +448,8 @@ class Eval(Cog):
                         color=SOFT_RED,
                     )
                 else:
-                    embed = Embed(
-                        title="Language Not Supported",
-                        description=f"Your language was invalid: {lang}\n"
-                        f"All Supported languages: [here](https://tio.run)\n\nUsage:\n"
-                        f"```{ctx.prefix}{ctx.command} {ctx.command.signature}```",
-                        color=SOFT_RED,
-                    )
-                await ctx.send(embed=embed)
+                    embed = self.language_error(ctx, lang)
+                await self.reply(ctx, embed=embed)
                 logger.info("Exiting | Language not found.")
                 return
 
@@ -146,7 +457,7 @@ class Eval(Cog):
                 if not (
                     any(map(lambda x: lang.split("-")[0] == x, self.wrapping))
                 ) or lang in ("cs-mono-shell", "cs-csi"):
-                    await ctx.send(f"`{lang}` cannot be wrapped")
+                    await self.reply(ctx, f"`{lang}` cannot be wrapped")
                     return
 
                 for beginning in self.wrapping:
@@ -154,36 +465,233 @@ class Eval(Cog):
                         text = self.wrapping[beginning].replace("code", text)
                         break
 
-            tio = Tio(lang, text, inputs, compiler_flags, command_line_options, args)
-            result = await tio.get_result()
-            result = result.rstrip("\n")
+            job = EvalJob(
+                lang,
+                text,
+                inputs,
+                tuple(compiler_flags),
+                tuple(command_line_options),
+                tuple(args),
+            )
+            queue_message: Optional[Message] = None
 
-            if not options["--stats"]:
-                try:
-                    start, end = result.rindex("Real time: "), result.rindex(
-                        "%\nExit code: "
-                    )
-                    result = result[:start] + result[end + 2 :]
-                except ValueError:
-                    pass
+            async def show_queue_position(position: int) -> None:
+                nonlocal queue_message
+                content = f"Lots of evals going on, you are #{position} in the queue..."
+                if queue_message is None:
+                    queue_message = await ctx.send(content)
+                else:
+                    await queue_message.edit(content=content)
 
+            try:
+                eval_result, timing = await self.run_cancellable(
+                    ctx,
+                    self.run_job(
+                        ctx, job, not options["--no-cache"], show_queue_position
+                    ),
+                )
+            except SchedulerQueueFull as e:
+                self.stats.record_failure(lang, "rejected")
+                await self.reply(ctx, f"{ctx.author.mention} {e}")
+                return
+            except EvalCancelled:
+                self.stats.record_failure(lang, "cancelled")
+                await self.reply(
+                    ctx, f"{ctx.author.mention} Your {lang} eval was cancelled."
+                )
+                return
+            except asyncio.TimeoutError:
+                self.stats.record_failure(lang, "timed out")
+                await self.reply(
+                    ctx,
+                    f"{ctx.author.mention} Your {lang} code didn't finish within "
+                    f"{Evals.job_timeout} seconds, so it was stopped.",
+                )
+                return
+            except EvalBackendError:
+                self.stats.record_failure(lang, "backend error")
+                await self.reply(
+                    ctx,
+                    f"{ctx.author.mention} Your {lang} code couldn't be run right now, "
+                    "try again later.",
+                )
+                return
+            finally:
+                if queue_message is not None:
+                    await queue_message.delete()
+
+            formatting_start = perf_counter()
+            output = EvalOutput.parse(eval_result.output, stats=options["--stats"])
             format_output = FormatOutput(language=lang)
+            excerpt, cut = format_output.excerpt(output)
 
-            if (
-                len(result) > format_output.max_output_length
-                or result.count("\n") > format_output.max_lines
-            ):
-                output = await eval_helper.paste(result)
+            file = None
+            upload = cut and self.paste_service.available
+            if upload:
+                # The link is edited in once the upload is done, so it can't delay the reply
+                embed = format_output.format_hastebin_output(
+                    output, excerpt, None, uploading=True
+                )
+            elif cut:
+                # Paste services are down or slow, don't make the output wait for them
+                file = output_file(output.body, Evals.attachment_gzip_threshold)
+                embed = format_output.format_hastebin_output(
+                    output, excerpt, None, attached=True
+                )
+            else:
+                embed = format_output.format_code_output(output, excerpt)
 
-                embed = format_output.format_hastebin_output(output, result)
+            footer = CACHED_FOOTER if eval_result.cached else None
+            if footer:
+                embed.set_footer(text=footer)
+            self.stats.record(
+                lang,
+                timing,
+                perf_counter() - formatting_start,
+                len(output.body),
+                output.exit_code,
+                pasted=cut,
+            )
+            message = await self.reply(
+                ctx, content=f"{ctx.author.mention}", embed=embed, file=file
+            )
+            logger.info("Result Sent.")
+
+        if upload:
+            task = asyncio.create_task(
+                self.add_paste_link(message, output, format_output, excerpt, footer)
+            )
+            self._track(self._paste_tasks, ctx.message.id, task)
+        return message
+
+    async def run_timed(
+        self, ctx: Context, job: EvalJob, use_cache: bool
+    ) -> MultiResult:
+        """Run `job` and return its output or why it failed, along with its wall time."""
+        start = perf_counter()
+        try:
+            # The blocks of a multi eval only count once towards the author's queue cap
+            eval_result, timing = await self.run_job(
+                ctx, job, use_cache, group=ctx.message.id
+            )
+        except SchedulerQueueFull as e:
+            self.stats.record_failure(job.language, "rejected")
+            return MultiResult(job.language, None, 0, error=str(e))
+        except asyncio.CancelledError:
+            # The whole multi eval was cancelled
+            self.stats.record_failure(job.language, "cancelled")
+            raise
+        except asyncio.TimeoutError:
+            self.stats.record_failure(job.language, "timed out")
+            return MultiResult(
+                job.language,
+                None,
+                perf_counter() - start,
+                error=f"Didn't finish within {Evals.job_timeout} seconds.",
+            )
+        except EvalBackendError:
+            self.stats.record_failure(job.language, "backend error")
+            return MultiResult(
+                job.language,
+                None,
+                perf_counter() - start,
+                error="Couldn't be run right now, try again later.",
+            )
+
+        output = EvalOutput.parse(eval_result.output, stats=False)
+        self.stats.record(
+            job.language, timing, None, len(output.body), output.exit_code
+        )
+        return MultiResult(
+            job.language, output, perf_counter() - start, cached=eval_result.cached
+        )
+
+    @eval_command.command(
+        help=f"""eval multi [--no-cache] <code blocks>
+
+            Run up to {Evals.multi_max_jobs} code blocks at once and compare their outputs,
+            exit codes and wall times. Each block runs in the language of its tag, so a
+            block starting with ```py runs Python and one starting with ```js JavaScript.
+
+            no-cache  - runs the code again even if the same code was run recently
+            """,
+        brief="Execute several code blocks in their languages at once",
+        name="multi",
+        aliases=("m",),
+    )
+    async def eval_multi(self, ctx: Context, *, code: str) -> Optional[Message]:
+        """
+        Evaluate every code block of the message concurrently and send one embed.
 
-                await ctx.send(content=f"{ctx.author.mention}", embed=embed)
-                logger.info("Result Sent.")
+        Return the bot response.
+        """
+        use_cache = "--no-cache" not in code.split("```", 1)[0].split()
+        blocks = CODE_BLOCK.findall(code)
+        if not blocks:
+            await self.reply(
+                ctx,
+                f"{ctx.author.mention} No code blocks with a language tag were found.",
+            )
+            return
+        if len(blocks) > Evals.multi_max_jobs:
+            await self.reply(
+                ctx,
+                f"{ctx.author.mention} At most {Evals.multi_max_jobs} code blocks "
+                "can be run at once.",
+            )
+            return
+
+        jobs = []
+        for tag, text in blocks:
+            lang = self.languages.resolve(tag.lower())
+            if not self.router.supports(lang):
+                await self.reply(ctx, embed=self.language_error(ctx, lang))
                 return
+            jobs.append(EvalJob(lang, text))
 
-            embed = format_output.format_code_output(result)
-            await ctx.send(content=f"{ctx.author.mention}", embed=embed)
-            logger.info("Result Sent.")
+        async with ctx.typing():
+            start = perf_counter()
+            # The scheduler caps how many of them, and of everyone's jobs, run at once
+            try:
+                results = await self.run_cancellable(
+                    ctx,
+                    asyncio.gather(
+                        *(self.run_timed(ctx, job, use_cache) for job in jobs)
+                    ),
+                )
+            except EvalCancelled:
+                await self.reply(
+                    ctx, f"{ctx.author.mention} Your multi eval was cancelled."
+                )
+                return
+            embed = format_multi_output(results, perf_counter() - start)
+            message = await self.reply(
+                ctx, content=f"{ctx.author.mention}", embed=embed
+            )
+            logger.info(f"Multi eval of {len(jobs)} jobs sent.")
+        return message
+
+    @eval_command.command(name="stats")
+    async def eval_stats(self, ctx: Context, days: int = 7) -> None:
+        """Show per-language eval latencies and outcomes of the last `days` days."""
+        totals = await self.stats.totals(self.bot.db_pool, days)
+        if not totals:
+            await ctx.send(f"No evals were run in the last {days} days.")
+            return
+
+        lines = []
+        for language, stats in sorted(
+            totals.items(), key=lambda item: item[1].requests, reverse=True
+        ):
+            lines.append("\n".join(self.stats.describe(language, stats)) + "\n")
+
+        embed = Embed(
+            title=f"Eval stats of the last {days} days",
+            colour=GREEN,
+        )
+        await LinePaginator.paginate(
+            lines, ctx, embed, max_lines=5, max_size=2000, allow_empty_lines=True
+        )
 
 
 def setup(bot: Bot) -> None:
@@ -0,0 +1,20 @@
+CREATE TABLE IF NOT EXISTS eval_stats (
+    language VARCHAR(128) NOT NULL,
+    day DATE NOT NULL DEFAULT CURRENT_DATE,
+    requests INTEGER NOT NULL DEFAULT 0,
+    pastes INTEGER NOT NULL DEFAULT 0,
+    -- Histograms, with the buckets defined in bot/exts/utils/_eval_stats.py
+    queue_ms INTEGER[] NOT NULL,
+    network_ms INTEGER[] NOT NULL,
+    format_ms INTEGER[] NOT NULL,
+    output_chars INTEGER[] NOT NULL,
+    exit_codes INTEGER[] NOT NULL,
+    outcomes INTEGER[] NOT NULL,
+    PRIMARY KEY (language, day)
+);
+
+-- Element-wise sum of two histograms
+CREATE OR REPLACE FUNCTION eval_stats_add(a INTEGER[], b INTEGER[]) RETURNS INTEGER[] AS $$
+    SELECT array_agg(COALESCE(x, 0) + COALESCE(y, 0) ORDER BY i)
+    FROM unnest(a, b) WITH ORDINALITY AS t(x, y, i)
+$$ LANGUAGE SQL IMMUTABLE;
@@ -1,4 +1,4 @@
-from typing import List
+from typing import Iterable, List, Sequence
 
 from asyncpg import Pool, Record
 from loguru import logger
@@ -14,6 +14,15 @@ async def db_execute(pool: Pool, sql_statement: str, *args) -> str:
     return status
 
 
+async def db_executemany(
+    pool: Pool, sql_statement: str, args: Iterable[Sequence]
+) -> None:
+    """Execute SQL statement once for every set of arguments."""
+    async with pool.acquire() as connection:
+        logger.info(f"Executing SQL for many arguments: {sql_statement}")
+        await connection.executemany(sql_statement, args)
+
+
 async def db_fetch(pool: Pool, sql_statement: str, *args) -> List[Record]:
     """Execute SQL statement."""
     async with pool.acquire() as connection:
@@ -0,0 +1,63 @@
+import asyncio
+from typing import Dict, Tuple
+
+from disnake import Asset
+from loguru import logger
+
+from bot.utils.cache import LRUCache
+
+MIN_CDN_SIZE = 16
+MAX_CDN_SIZE = 4096
+
+
+def cdn_size(size: int) -> int:
+    """Return the smallest size the CDN can serve that is at least `size` pixels."""
+    served_size = MIN_CDN_SIZE
+    while served_size < min(size, MAX_CDN_SIZE):
+        served_size *= 2
+    return served_size
+
+
+class AvatarService:
+    """
+    Fetch avatars from the CDN at the smallest size a consumer needs.
+
+    Downloads are cached by (asset key, size) for `ttl` seconds, and concurrent requests for
+    the same avatar share a single download.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float) -> None:
+        self.cache = LRUCache(max_bytes, ttl=ttl)
+        self.downloads = 0
+        self._in_flight: Dict[Tuple[str, int, bool], asyncio.Task] = {}
+
+    async def _download(self, avatar: Asset, key: Tuple[str, int, bool]) -> bytes:
+        try:
+            data = await avatar.read()
+            self.downloads += 1
+            self.cache.set(key, data)
+            logger.trace(f"Downloaded avatar {key} ({len(data)} bytes).")
+            return data
+        finally:
+            del self._in_flight[key]
+
+    async def fetch(self, avatar: Asset, size: int, static: bool = True) -> bytes:
+        """
+        Return the bytes of `avatar`, at least `size` pixels wide.
+
+        If `static` is True, animated avatars are fetched as a PNG of their first frame.
+        """
+        size = cdn_size(size)
+        key = (avatar.key, size, static)
+
+        if (data := self.cache.get(key)) is not None:
+            return data
+
+        if (task := self._in_flight.get(key)) is None:
+            if static and avatar.is_animated():
+                avatar = avatar.with_format("png")
+            task = asyncio.create_task(self._download(avatar.with_size(size), key))
+            self._in_flight[key] = task
+
+        # Shield the download, so one requester going away doesn't cancel it for the others
+        return await asyncio.shield(task)
@@ -0,0 +1,184 @@
+import hashlib
+import math
+import os
+from collections import OrderedDict
+from contextlib import suppress
+from pathlib import Path
+from time import monotonic
+from typing import Any, Callable, Hashable, Iterator, Optional, Tuple
+
+from loguru import logger
+
+
+class CacheStats:
+    """Hit, miss and eviction counters of a cache."""
+
+    def __init__(self) -> None:
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def hit_rate(self) -> float:
+        """Fraction of lookups that were served from the cache."""
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def __repr__(self) -> str:
+        return (
+            f"<CacheStats hits={self.hits} misses={self.misses} "
+            f"evictions={self.evictions} hit_rate={self.hit_rate:.0%}>"
+        )
+
+
+class LRUCache:
+    """
+    An in-memory least-recently-used cache bounded by the total size of its values.
+
+    The size of a value is given by `sizeof`, which defaults to `len` so byte strings are
+    accounted for by their length. Entries older than `ttl` seconds are treated as missing.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int,
+        sizeof: Callable[[Any], int] = len,
+        ttl: Optional[float] = None,
+    ) -> None:
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.ttl = ttl
+        self.nbytes = 0
+        self.stats = CacheStats()
+        self._entries: OrderedDict[Hashable, Tuple[Any, float]] = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the value stored under `key`, or None if it isn't cached or expired."""
+        try:
+            value, expires_at = self._entries[key]
+        except KeyError:
+            self.stats.misses += 1
+            return None
+
+        if expires_at < monotonic():
+            self.pop(key)
+            self.stats.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.stats.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        """Store `value` under `key`, evicting the least recently used values if needed."""
+        size = self.sizeof(value)
+        if size > self.max_bytes:
+            logger.debug(f"Not caching {key!r}: {size} bytes exceeds the cache size.")
+            return
+
+        self.pop(key)
+        expires_at = monotonic() + self.ttl if self.ttl is not None else math.inf
+        self._entries[key] = (value, expires_at)
+        self.nbytes += size
+
+        while self.nbytes > self.max_bytes:
+            _, (evicted, _) = self._entries.popitem(last=False)
+            self.nbytes -= self.sizeof(evicted)
+            self.stats.evictions += 1
+
+    def pop(self, key: Hashable) -> Optional[Any]:
+        """Remove and return the value stored under `key`, if any."""
+        try:
+            value, _ = self._entries.pop(key)
+        except KeyError:
+            return None
+
+        self.nbytes -= self.sizeof(value)
+        return value
+
+    def clear(self) -> None:
+        """Remove every entry from the cache."""
+        self._entries.clear()
+        self.nbytes = 0
+
+    def __contains__(self, key: Hashable) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and entry[1] >= monotonic()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class DiskCache:
+    """
+    A directory of byte blobs bounded by their total size.
+
+    Keys are hashed into file names and the least recently read files are removed first
+    once `max_bytes` is exceeded. Methods do blocking file IO, so call them from a thread.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int, suffix: str = "") -> None:
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.stats = CacheStats()
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+        return self.directory / f"{digest}{self.suffix}"
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the blob stored under `key`, or None if it isn't cached."""
+        path = self._path(key)
+        try:
+            data = path.read_bytes()
+        except FileNotFoundError:
+            self.stats.misses += 1
+            return None
+
+        # Mark the file as recently used, unless it was evicted since the read
+        with suppress(FileNotFoundError):
+            os.utime(path)
+        self.stats.hits += 1
+        return data
+
+    def set(self, key: str, data: bytes) -> None:
+        """Store `data` under `key`, removing the least recently used files if needed."""
+        path = self._path(key)
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_bytes(data)
+        tmp_path.replace(path)
+        self._evict()
+
+    def _files(self) -> Iterator[Tuple[Path, os.stat_result]]:
+        """
+        Yield the cached files with their stats.
+
+        Files still being written are left out, as are those evicted by another thread
+        since the directory was listed.
+        """
+        for path in self.directory.glob(f"*{self.suffix}"):
+            if path.suffix == ".tmp":
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            yield path, stat
+
+    @property
+    def nbytes(self) -> int:
+        """Total size of the cached files, in bytes."""
+        return sum(stat.st_size for _, stat in self._files())
+
+    def _evict(self) -> None:
+        entries = sorted(self._files(), key=lambda entry: entry[1].st_mtime)
+        total = sum(stat.st_size for _, stat in entries)
+        for path, stat in entries:
+            if total <= self.max_bytes:
+                break
+            path.unlink(missing_ok=True)
+            total -= stat.st_size
+            self.stats.evictions += 1
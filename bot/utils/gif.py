@@ -0,0 +1,215 @@
+import struct
+from io import BytesIO
+from typing import Iterable, List, Optional, Tuple
+
+from PIL import Image, ImageChops
+
+GIF_HEADER = b"GIF89a"
+GIF_TRAILER = b";"
+
+EXTENSION_INTRODUCER = 0x21
+IMAGE_SEPARATOR = 0x2C
+GRAPHIC_CONTROL_LABEL = 0xF9
+
+# Palette entry never mapped to a colour, marking the pixels a differenced frame leaves as is
+TRANSPARENT_INDEX = 255
+
+
+def _skip_sub_blocks(data: bytes, index: int) -> int:
+    """Return the index just past the chain of data sub-blocks starting at `index`."""
+    while data[index]:
+        index += data[index] + 1
+    return index + 1
+
+
+def _colour_table_length(packed: int) -> int:
+    """Return the byte length of the colour table described by a packed flags byte."""
+    return 3 * (2 ** ((packed & 0b111) + 1)) if packed & 0b10000000 else 0
+
+
+def split_frame(
+    gif: bytes, offset: Tuple[int, int] = (0, 0), local_palette: bool = True
+) -> bytes:
+    """
+    Extract the first frame of an encoded GIF as a block that can be spliced into a stream.
+
+    The block holds the graphic control extension, the image descriptor, a local colour
+    table and the LZW data. If the encoder put the palette in the global colour table it is
+    moved into the frame, so the block is self-contained. With `local_palette` False the
+    colour table is dropped instead, for streams whose frames share a global palette.
+    The frame is positioned at `offset` on the canvas.
+    """
+    if gif[:6] not in (b"GIF87a", b"GIF89a"):
+        raise ValueError("Not a GIF stream.")
+
+    packed = gif[10]
+    global_table = gif[13 : 13 + _colour_table_length(packed)]
+    index = 13 + len(global_table)
+
+    graphic_control = b""
+    while index < len(gif):
+        block_type = gif[index]
+
+        if block_type == EXTENSION_INTRODUCER:
+            end = _skip_sub_blocks(gif, index + 2)
+            if gif[index + 1] == GRAPHIC_CONTROL_LABEL:
+                graphic_control = gif[index:end]
+            index = end
+
+        elif block_type == IMAGE_SEPARATOR:
+            descriptor = bytearray(gif[index : index + 10])
+            struct.pack_into("<HH", descriptor, 1, *offset)
+            local_table_length = _colour_table_length(descriptor[9])
+            table_end = index + 10 + local_table_length
+            local_table = gif[index + 10 : table_end]
+
+            if not local_palette:
+                descriptor[9] &= 0b01111000
+                local_table = b""
+            elif not local_table and global_table:
+                # Promote the global table to a local one of the same size
+                descriptor[9] |= 0b10000000 | (packed & 0b111)
+                local_table = global_table
+
+            data_end = _skip_sub_blocks(gif, table_end + 1)
+            return (
+                graphic_control
+                + bytes(descriptor)
+                + local_table
+                + gif[table_end:data_end]
+            )
+
+        else:
+            break
+
+    raise ValueError("GIF stream has no image data.")
+
+
+def encode_frame(
+    image: Image.Image,
+    duration: int,
+    disposal: int = 0,
+    offset: Tuple[int, int] = (0, 0),
+    transparency: Optional[int] = None,
+    local_palette: bool = True,
+) -> bytes:
+    """
+    Encode a single image into a GIF frame block that can be passed to `assemble`.
+
+    With `local_palette` False, `image` must be a "P" image already mapped to the palette
+    that will be given to `assemble`. The indices of "P" images are kept as they are.
+    """
+    params = {"duration": duration, "disposal": disposal}
+    if transparency is not None:
+        params["transparency"] = transparency
+    if image.mode == "P":
+        params[
+            "optimize"
+        ] = False  # Keep the indices, which may refer to a shared palette
+
+    buffer = BytesIO()
+    image.save(buffer, "GIF", **params)
+    return split_frame(buffer.getvalue(), offset, local_palette)
+
+
+def assemble(
+    size: Tuple[int, int],
+    frames: Iterable[bytes],
+    loop: Optional[int] = 0,
+    palette: Optional[bytes] = None,
+) -> bytes:
+    """
+    Concatenate encoded frame blocks into a complete animated GIF.
+
+    `palette` is written as the global colour table, used by the frames without a local one.
+    """
+    if palette is None:
+        # Logical screen descriptor, without a global colour table
+        parts: List[bytes] = [GIF_HEADER, struct.pack("<HHBBB", *size, 0, 0, 0)]
+    else:
+        palette = palette[:768].ljust(768, b"\x00")
+        parts = [GIF_HEADER, struct.pack("<HHBBB", *size, 0b11110111, 0, 0), palette]
+
+    if loop is not None:
+        parts.append(b"\x21\xff\x0bNETSCAPE2.0" + struct.pack("<BBHB", 3, 1, loop, 0))
+    parts.extend(frames)
+    parts.append(GIF_TRAILER)
+    return b"".join(parts)
+
+
+class FrameEncoder:
+    """
+    Encode a sequence of frames into blocks for `assemble`.
+
+    Frames are quantized to an adaptive palette of their own, or mapped to `palette`, which
+    must then be passed to `assemble` as the global palette. With `diff_threshold` set, only
+    the pixels whose luma differs by more than it from what is on screen are redrawn, the
+    rest are left transparent. The error is measured against the displayed image rather than
+    the previous frame, so skipped changes can't add up over frames.
+    """
+
+    def __init__(
+        self,
+        palette: Optional[bytes] = None,
+        diff_threshold: Optional[int] = None,
+        dither: bool = False,
+        displayed: Optional[Image.Image] = None,
+    ) -> None:
+        self.palette = palette
+        self.diff_threshold = diff_threshold
+        self.dither = Image.Dither.FLOYDSTEINBERG if dither else Image.Dither.NONE
+        self.displayed = displayed.copy() if displayed is not None else None
+
+        self._palette_image = None
+        if palette is not None:
+            self._palette_image = Image.new("P", (1, 1))
+            # Leave out the transparent entry so no colour gets mapped to it
+            self._palette_image.putpalette(palette[: TRANSPARENT_INDEX * 3])
+
+        self._redraw_lut = [
+            0 if value <= (diff_threshold or 0) else 255 for value in range(256)
+        ]
+
+    def _quantize(self, image: Image.Image) -> Image.Image:
+        if self._palette_image is not None:
+            return image.quantize(palette=self._palette_image, dither=self.dither)
+
+        quantized = image.quantize(TRANSPARENT_INDEX, Image.Quantize.FASTOCTREE)
+        # Pad the palette, so the transparent index is part of the colour table
+        quantized.putpalette(bytes(quantized.getpalette()).ljust(768, b"\x00"))
+        return quantized
+
+    def encode(self, image: Image.Image, duration: int, disposal: int = 0) -> bytes:
+        """Encode the next frame of the sequence."""
+        image = image.convert("RGB")
+        local_palette = self.palette is None
+
+        if self.diff_threshold is None or self.displayed is None:
+            quantized = self._quantize(image)
+            if self.diff_threshold is not None:
+                self.displayed = quantized.convert("RGB")
+                disposal = 1  # Following frames are drawn on top of this one
+            return encode_frame(
+                quantized, duration, disposal, local_palette=local_palette
+            )
+
+        redraw = (
+            ImageChops.difference(image, self.displayed)
+            .convert("L")
+            .point(self._redraw_lut)
+        )
+        bbox = redraw.getbbox() or (0, 0, 1, 1)
+        redraw = redraw.crop(bbox)
+
+        delta = self._quantize(image.crop(bbox))
+        self.displayed.paste(delta.convert("RGB"), bbox[:2], redraw)
+        delta.paste(TRANSPARENT_INDEX, mask=ImageChops.invert(redraw))
+
+        return encode_frame(
+            delta,
+            duration,
+            disposal=1,
+            offset=bbox[:2],
+            transparency=TRANSPARENT_INDEX,
+            local_palette=local_palette,
+        )
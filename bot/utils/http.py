@@ -0,0 +1,117 @@
+from time import monotonic
+from typing import Any, Awaitable, Callable, Optional
+
+from aiohttp import ClientSession, ClientTimeout, TCPConnector, TraceConfig
+from loguru import logger
+
+
+class ConnectionStats:
+    """
+    Request and connection counters of a session, fed by its trace config.
+
+    A connection is either created, paying for the DNS lookup, TCP and TLS handshakes, or
+    reused from the keep-alive pool.
+    """
+
+    def __init__(self) -> None:
+        self.requests = 0
+        self.connections_created = 0
+        self.connections_reused = 0
+        self.dns_cache_hits = 0
+        self.dns_cache_misses = 0
+
+    @property
+    def reuse_rate(self) -> float:
+        """Fraction of connections that were reused from the pool."""
+        connections = self.connections_created + self.connections_reused
+        return self.connections_reused / connections if connections else 0.0
+
+    def trace_config(self) -> TraceConfig:
+        """Create a trace config counting into these stats, for `ClientSession`."""
+        trace_config = TraceConfig()
+
+        def counter(attribute: str) -> Callable[..., Awaitable[None]]:
+            async def increment(*_: Any) -> None:
+                setattr(self, attribute, getattr(self, attribute) + 1)
+
+            return increment
+
+        trace_config.on_request_start.append(counter("requests"))
+        trace_config.on_connection_create_end.append(counter("connections_created"))
+        trace_config.on_connection_reuseconn.append(counter("connections_reused"))
+        trace_config.on_dns_cache_hit.append(counter("dns_cache_hits"))
+        trace_config.on_dns_cache_miss.append(counter("dns_cache_misses"))
+        return trace_config
+
+    def __repr__(self) -> str:
+        return (
+            f"<ConnectionStats requests={self.requests} "
+            f"created={self.connections_created} reused={self.connections_reused} "
+            f"reuse_rate={self.reuse_rate:.0%} dns_hits={self.dns_cache_hits} "
+            f"dns_misses={self.dns_cache_misses}>"
+        )
+
+
+def pooled_session(
+    stats: ConnectionStats,
+    limit_per_host: int,
+    total_timeout: float,
+    connect_timeout: float,
+    dns_ttl: int,
+) -> ClientSession:
+    """
+    Create a session keeping connections alive between requests.
+
+    Resolved hosts are cached for `dns_ttl` seconds and at most `limit_per_host` connections
+    are opened to a single host. Requests and connections are counted into `stats`.
+    """
+    connector = TCPConnector(
+        limit_per_host=limit_per_host, ttl_dns_cache=dns_ttl, use_dns_cache=True
+    )
+    return ClientSession(
+        connector=connector,
+        timeout=ClientTimeout(total=total_timeout, connect=connect_timeout),
+        trace_configs=[stats.trace_config()],
+    )
+
+
+class CircuitBreaker:
+    """
+    Skips a service after repeated failures, until it has had time to recover.
+
+    Once `failure_threshold` calls in a row have failed, the circuit opens and the service
+    isn't called for `reset_timeout` seconds. The next call after that is a trial: its
+    success closes the circuit, and its failure opens it again.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self._opened_at: Optional[float] = None
+
+    @property
+    def is_open(self) -> bool:
+        """Whether calls to the service are being skipped."""
+        return (
+            self._opened_at is not None
+            and monotonic() - self._opened_at < self.reset_timeout
+        )
+
+    def record_success(self) -> None:
+        """Close the circuit after a successful call."""
+        if self._opened_at is not None:
+            logger.info(f"{self.name} has recovered, closing its circuit.")
+        self.failures = 0
+        self._opened_at = None
+
+    def record_failure(self) -> None:
+        """Count a failed call, opening the circuit if there were too many in a row."""
+        self.failures += 1
+        if self.failures >= self.failure_threshold:
+            logger.warning(
+                f"{self.name} failed {self.failures} times in a row, skipping it "
+                f"for {self.reset_timeout:g}s."
+            )
+            self._opened_at = monotonic()
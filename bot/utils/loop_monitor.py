@@ -0,0 +1,183 @@
+import asyncio
+import time
+from asyncio import AbstractEventLoop, Task
+from collections import deque
+from collections.abc import Coroutine
+from typing import Any, Callable, Deque, List, NamedTuple, Optional
+from weakref import WeakKeyDictionary
+
+from disnake.ext.tasks import Loop
+from loguru import logger
+
+
+class SlowStep(NamedTuple):
+    """A task step that held the event loop for `duration` seconds, at `at` (monotonic)."""
+
+    name: str
+    duration: float
+    at: float
+
+
+def coroutine_name(coro: Optional[Coroutine]) -> str:
+    """Return the qualified name of `coro`, or of the `tasks.loop` it runs."""
+    if coro is None:
+        return "<finished>"
+    frame = getattr(coro, "cr_frame", None)
+    if frame is not None and isinstance(loop := frame.f_locals.get("self"), Loop):
+        return f"tasks.loop {loop.coro.__qualname__}"
+    return getattr(coro, "__qualname__", None) or type(coro).__qualname__
+
+
+def task_name(task: Task) -> str:
+    """Return the name of the coroutine of `task`."""
+    return coroutine_name(task.get_coro())
+
+
+def awaited_name(task: Task) -> Optional[str]:
+    """Return the name of the innermost coroutine `task` is awaiting, if any."""
+    coro = task.get_coro()
+    name = None
+    while (coro := getattr(coro, "cr_await", None)) is not None:
+        if hasattr(coro, "cr_await"):
+            name = coroutine_name(coro)
+    return name
+
+
+class _TimedCoroutine(Coroutine):
+    """Wraps the coroutine of a task, to time each step the task runs."""
+
+    def __init__(self, coro: Coroutine, monitor: "LoopMonitor") -> None:
+        self.__wrapped__ = coro
+        self.__name__ = getattr(coro, "__name__", type(coro).__name__)
+        self.__qualname__ = getattr(coro, "__qualname__", type(coro).__qualname__)
+        self._monitor = monitor
+
+    @property
+    def cr_frame(self) -> Any:
+        return getattr(self.__wrapped__, "cr_frame", None)
+
+    @property
+    def cr_await(self) -> Any:
+        return getattr(self.__wrapped__, "cr_await", None)
+
+    @property
+    def cr_running(self) -> bool:
+        return getattr(self.__wrapped__, "cr_running", False)
+
+    @property
+    def cr_code(self) -> Any:
+        return getattr(self.__wrapped__, "cr_code", None)
+
+    def _step(self, method: Callable, *args) -> Any:
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            duration = time.perf_counter() - start
+            if duration >= self._monitor.slow_step_duration:
+                self._monitor.record_slow_step(self.__wrapped__, duration)
+
+    def send(self, value: Any) -> Any:
+        return self._step(self.__wrapped__.send, value)
+
+    def throw(self, *exc_info) -> Any:
+        return self._step(self.__wrapped__.throw, *exc_info)
+
+    def close(self) -> None:
+        self.__wrapped__.close()
+
+    def __await__(self) -> Any:
+        return self.__wrapped__.__await__()
+
+
+class LoopMonitor:
+    """
+    Records the health of an event loop while the bot runs.
+
+    Once installed, it measures the lag of the loop every `interval` seconds, keeping
+    the last `max_samples` measures. Its task factory stamps new tasks with their
+    creation time and times the steps they run, keeping the last `max_slow_steps` that
+    held the loop longer than `slow_step_duration` seconds. Callbacks that aren't task
+    steps only show in the lag.
+    """
+
+    def __init__(
+        self,
+        interval: float,
+        max_samples: int,
+        slow_step_duration: float,
+        max_slow_steps: int,
+    ) -> None:
+        self.interval = interval
+        self.slow_step_duration = slow_step_duration
+        self.lags: Deque[float] = deque(maxlen=max_samples)
+        self.slow_steps: Deque[SlowStep] = deque(maxlen=max_slow_steps)
+        # Monotonic creation time of the tasks created since the install
+        self.created: "WeakKeyDictionary[Task, float]" = WeakKeyDictionary()
+
+        self._loop: Optional[AbstractEventLoop] = None
+        self._factory: Optional[Callable] = None
+        self._sampler: Optional[Task] = None
+
+    def install(self, loop: AbstractEventLoop) -> None:
+        """Start monitoring `loop`, which may not be running yet."""
+        if self._loop is not None:
+            raise RuntimeError("The monitor is already installed.")
+
+        self._loop = loop
+        self._factory = loop.get_task_factory()
+        loop.set_task_factory(self._create_task)
+        self._sampler = loop.create_task(self._sample_lag())
+        logger.info(
+            f"Monitoring the event loop every {self.interval}s, recording task steps "
+            f"slower than {self.slow_step_duration * 1000:.0f}ms"
+        )
+
+    def uninstall(self) -> None:
+        """Stop monitoring, restoring the task factory of the loop."""
+        if self._loop is None:
+            return
+
+        self._sampler.cancel()
+        self._loop.set_task_factory(self._factory)
+        self._loop = None
+
+    def _create_task(
+        self, loop: AbstractEventLoop, coro: Coroutine, **kwargs: Any
+    ) -> Task:
+        coro = _TimedCoroutine(coro, self)
+        if self._factory is None:
+            task = Task(coro, loop=loop, **kwargs)
+        else:
+            task = self._factory(loop, coro, **kwargs)
+        self.created[task] = time.monotonic()
+        return task
+
+    def record_slow_step(self, coro: Coroutine, duration: float) -> None:
+        """Record that a step of the task running `coro` took `duration` seconds."""
+        self.slow_steps.append(
+            SlowStep(coroutine_name(coro), duration, time.monotonic())
+        )
+
+    async def _sample_lag(self) -> None:
+        """Measure how late the loop wakes up a sleeping task."""
+        while True:
+            start = time.monotonic()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(time.monotonic() - start - self.interval, 0))
+
+    def age(self, task: Task) -> Optional[float]:
+        """Return the seconds since `task` was created, if it was created while installed."""
+        created = self.created.get(task)
+        return None if created is None else time.monotonic() - created
+
+    def lag_percentiles(self, quantiles: List[float]) -> Optional[List[float]]:
+        """Return the lag at each of `quantiles` over the recent samples, in seconds."""
+        if not self.lags:
+            return None
+        lags = sorted(self.lags)
+        return [lags[min(int(q * len(lags)), len(lags) - 1)] for q in quantiles]
+
+    def slowest_steps(self, n: int) -> List[SlowStep]:
+        """Return the `n` slowest task steps recorded recently, the slowest first."""
+        return sorted(self.slow_steps, key=lambda step: step.duration, reverse=True)[:n]
@@ -0,0 +1,161 @@
+import cProfile
+import marshal
+import os
+import pstats
+import sys
+import sysconfig
+import threading
+from abc import ABC, abstractmethod
+from collections import Counter
+from types import CodeType, FrameType
+from typing import Dict, List, Optional, Tuple
+
+# Functions with their time, or sample count, sorted from the hottest
+Ranking = List[Tuple[str, float]]
+
+
+# Paths that are left out of the labels of functions, from the most specific
+_PREFIXES = sorted(
+    {os.getcwd(), *sysconfig.get_paths().values()}, key=len, reverse=True
+)
+
+
+def _label(filename: str, line: int, name: str) -> str:
+    """Return a short label of a function, with its path relative to the project or lib."""
+    for prefix in _PREFIXES:
+        if filename.startswith(prefix + os.sep):
+            filename = filename[len(prefix) + 1 :]
+            break
+    return f"{name} ({filename}:{line})"
+
+
+class Profiler(ABC):
+    """
+    Profiles the current thread while used as a context manager.
+
+    In the bot, that thread runs the event loop, so every task running meanwhile is
+    profiled along with the code of interest.
+    """
+
+    # What the rankings count
+    unit = "s"
+
+    @abstractmethod
+    def __enter__(self) -> "Profiler":
+        """Start profiling."""
+
+    @abstractmethod
+    def __exit__(self, *exc_info) -> None:
+        """Stop profiling."""
+
+    @abstractmethod
+    def top(self, n: int) -> Tuple[Ranking, Ranking]:
+        """Return the `n` hottest functions by cumulative time, then by self time."""
+
+    @abstractmethod
+    def dump(self) -> Tuple[str, bytes]:
+        """Return the name and the content of a file holding the complete profile."""
+
+
+class DeterministicProfiler(Profiler):
+    """
+    Records every function call with cProfile.
+
+    Timings are exact, but the overhead on call-heavy code is high. The dump is a
+    pstats file, readable with `python -m pstats` or snakeviz.
+    """
+
+    def __init__(self) -> None:
+        self.profile = cProfile.Profile()
+
+    def __enter__(self) -> "DeterministicProfiler":
+        self.profile.enable()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.profile.disable()
+
+    def _stats(self) -> Dict[Tuple[str, int, str], tuple]:
+        return pstats.Stats(self.profile).stats
+
+    def top(self, n: int) -> Tuple[Ranking, Ranking]:
+        """Return the `n` hottest functions by cumulative time, then by self time."""
+        stats = self._stats()
+        cumulative = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)
+        own = sorted(stats.items(), key=lambda item: item[1][2], reverse=True)
+        return (
+            [(_label(*func), timings[3]) for func, timings in cumulative[:n]],
+            [(_label(*func), timings[2]) for func, timings in own[:n]],
+        )
+
+    def dump(self) -> Tuple[str, bytes]:
+        """Return the profile in the format of `pstats.Stats.dump_stats`."""
+        return "profile.pstats", marshal.dumps(self._stats())
+
+
+class SamplingProfiler(Profiler):
+    """
+    Samples the stack of the current thread from another thread, every `interval` seconds.
+
+    The overhead doesn't depend on the code profiled, so it can run on hot paths, but
+    short functions may be missed. The dump holds collapsed stacks, the input of most
+    flame graph tools.
+    """
+
+    unit = "samples"
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self.samples: Dict[Tuple[str, ...], int] = Counter()
+        self._thread_id = threading.get_ident()
+        self._stop = threading.Event()
+        self._sampler: Optional[threading.Thread] = None
+        self._labels: Dict[CodeType, str] = {}
+
+    def __enter__(self) -> "SamplingProfiler":
+        self._sampler = threading.Thread(
+            target=self._sample, name="sampling-profiler", daemon=True
+        )
+        self._sampler.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._sampler.join()
+
+    def _stack(self, frame: Optional[FrameType]) -> Tuple[str, ...]:
+        """Return the labels of the functions of the stack, from the outermost one."""
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            if (label := self._labels.get(code)) is None:
+                label = _label(code.co_filename, code.co_firstlineno, code.co_name)
+                self._labels[code] = label
+            stack.append(label)
+            frame = frame.f_back
+        return tuple(reversed(stack))
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.interval):
+            # The frame is only read, while the profiled thread may move on
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                self.samples[self._stack(frame)] += 1
+
+    def top(self, n: int) -> Tuple[Ranking, Ranking]:
+        """Return the `n` functions sampled the most, anywhere in the stack then on top."""
+        cumulative = Counter()
+        own = Counter()
+        for stack, count in self.samples.items():
+            # Recursive functions count once per sample
+            for label in set(stack):
+                cumulative[label] += count
+            own[stack[-1]] += count
+        return cumulative.most_common(n), own.most_common(n)
+
+    def dump(self) -> Tuple[str, bytes]:
+        """Return the samples as collapsed stacks, one `outer;...;inner count` per line."""
+        lines = (
+            f"{';'.join(stack)} {count}\n" for stack, count in self.samples.items()
+        )
+        return "profile.collapsed", "".join(lines).encode("utf-8")
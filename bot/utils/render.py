@@ -0,0 +1,111 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Deque, Optional
+
+from loguru import logger
+
+from bot.utils.scheduler import (
+    FairScheduler,
+    JobTiming,
+    PositionCallback,
+    SchedulerQueueFull,
+)
+
+
+class RenderQueueFull(Exception):
+    """Raised when a render job is submitted while the render queue is full."""
+
+    pass
+
+
+class RenderService:
+    """
+    A bounded queue of CPU-bound render jobs in front of a shared process pool.
+
+    Jobs beyond the number of workers wait in FIFO order and can be told their position in
+    the queue as it moves. Functions and their arguments are sent to worker processes, so
+    they must be picklable, i.e. module-level functions or static methods.
+    """
+
+    # Every job is queued under the same user of the scheduler, which makes it FIFO
+    QUEUE = "render"
+
+    def __init__(self, workers: int, max_queue: int) -> None:
+        self.workers = workers
+        self.max_queue = max_queue
+
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._scheduler = FairScheduler(workers, max_queue, max_queue)
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of jobs waiting for a worker."""
+        return self._scheduler.queue_depth
+
+    @property
+    def running(self) -> int:
+        """Number of jobs being rendered."""
+        return self._scheduler.running
+
+    @property
+    def timings(self) -> Deque[JobTiming]:
+        """Time the last jobs spent queued and rendering."""
+        return self._scheduler.timings
+
+    @property
+    def jobs_run(self) -> int:
+        """Number of jobs rendered, successfully or not."""
+        return self._scheduler.jobs_run
+
+    @property
+    def jobs_rejected(self) -> int:
+        """Number of jobs rejected because the queue was full."""
+        return self._scheduler.jobs_rejected
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        # The pool is only spawned once something is rendered, so boot doesn't pay for it
+        if self._executor is None:
+            logger.info(f"Starting render pool with {self.workers} workers.")
+            self._executor = ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    async def _render(self, func: Callable[..., Any], *args) -> Any:
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._get_executor(), func, *args
+            )
+        except BrokenProcessPool:
+            logger.error("Render pool broke, it will be restarted for the next job.")
+            self._executor = None
+            raise
+
+    async def submit(
+        self,
+        func: Callable[..., Any],
+        *args,
+        on_position: Optional[PositionCallback] = None,
+    ) -> Any:
+        """
+        Run `func(*args)` in the render pool and return its result.
+
+        `on_position` is awaited with the 1-based queue position whenever the job has to
+        wait. RenderQueueFull is raised if the queue has no room left.
+        """
+        try:
+            return await self._scheduler.submit(
+                self.QUEUE, self._render, func, *args, on_position=on_position
+            )
+        except SchedulerQueueFull as e:
+            raise RenderQueueFull(
+                f"The render queue is full ({self.max_queue} jobs)."
+            ) from e
+
+    def shutdown(self) -> None:
+        """Stop the worker processes."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
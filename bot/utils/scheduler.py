@@ -0,0 +1,210 @@
+import asyncio
+from collections import OrderedDict, deque
+from time import perf_counter
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Deque,
+    Dict,
+    Hashable,
+    NamedTuple,
+    Optional,
+)
+
+from loguru import logger
+
+PositionCallback = Callable[[int], Awaitable[None]]
+
+
+class SchedulerQueueFull(Exception):
+    """Raised when a job is submitted while the queue, or the user's share of it, is full."""
+
+    pass
+
+
+class JobTiming(NamedTuple):
+    """Time a job spent queued and running, in seconds."""
+
+    wait: float
+    run: float
+
+
+class FairScheduler:
+    """
+    A bounded queue of coroutine jobs with a global concurrency cap, fair between users.
+
+    Waiting jobs are served round-robin across users, so someone queueing many jobs only
+    delays their own. Jobs submitted together in a group count as one towards the user's
+    share of the queue. Jobs can be told their position in the queue as it moves, and are
+    cancelled once they run past their timeout.
+    """
+
+    def __init__(
+        self, max_running: int, max_queue: int, max_queue_per_user: int
+    ) -> None:
+        self.max_running = max_running
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self.timings: Deque[JobTiming] = deque(maxlen=100)
+        self.jobs_run = 0
+        self.jobs_rejected = 0
+        self.jobs_timed_out = 0
+        self.jobs_cancelled = 0
+
+        self._running = 0
+        # Waiting jobs of each user, in the order the users will be served
+        self._queues: OrderedDict[Hashable, Deque[asyncio.Future]] = OrderedDict()
+        # Group of the waiting jobs submitted in one
+        self._groups: Dict[asyncio.Future, Hashable] = {}
+        self._queue_moved = asyncio.Event()
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of jobs waiting to run."""
+        return sum(map(len, self._queues.values()))
+
+    @property
+    def running(self) -> int:
+        """Number of jobs running."""
+        return self._running
+
+    def _position(self, user: Hashable, waiter: asyncio.Future) -> int:
+        """Return the 1-based number of the turn `waiter` will get to run."""
+        queue = self._queues[user]
+        index = queue.index(waiter)
+        ahead = index
+        for other_user, other_queue in self._queues.items():
+            if other_user == user:
+                # The users after this one only get `index` turns before it
+                index -= 1
+                continue
+            ahead += min(len(other_queue), index + 1)
+        return ahead + 1
+
+    def _release(self) -> None:
+        """Hand the freed slot to the next user in turn."""
+        self._running -= 1
+        while self._queues:
+            user, queue = self._queues.popitem(last=False)
+            waiter = queue.popleft()
+            self._groups.pop(waiter, None)
+            if queue:
+                self._queues[user] = queue  # Back of the line for the user's next job
+            if not waiter.done():
+                self._running += 1
+                waiter.set_result(None)
+                break
+
+        self._queue_moved.set()
+        self._queue_moved = asyncio.Event()
+
+    def _remove(self, user: Hashable, waiter: asyncio.Future) -> None:
+        self._groups.pop(waiter, None)
+        queue = self._queues.get(user)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del self._queues[user]
+
+    async def _acquire(
+        self,
+        user: Hashable,
+        on_position: Optional[PositionCallback],
+        group: Optional[Hashable],
+    ) -> None:
+        """Wait for a slot, reporting the position in the queue as it changes."""
+        if self._running < self.max_running and not self._queues:
+            self._running += 1
+            return
+
+        if self.queue_depth >= self.max_queue:
+            self.jobs_rejected += 1
+            raise SchedulerQueueFull(
+                "Too many jobs are queued right now, try again later."
+            )
+        # Jobs of a group only take one place of the user's share together
+        queued = {
+            self._groups.get(waiter, waiter) for waiter in self._queues.get(user, ())
+        }
+        if (group is None or group not in queued) and len(
+            queued
+        ) >= self.max_queue_per_user:
+            self.jobs_rejected += 1
+            raise SchedulerQueueFull(
+                f"You already have {self.max_queue_per_user} jobs queued, "
+                "wait for them to finish."
+            )
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(user, deque()).append(waiter)
+        if group is not None:
+            self._groups[waiter] = group
+        try:
+            while not waiter.done():
+                if on_position is not None:
+                    await on_position(self._position(user, waiter))
+                    if waiter.done():
+                        break
+
+                moved = asyncio.ensure_future(self._queue_moved.wait())
+                try:
+                    await asyncio.wait(
+                        {waiter, moved}, return_when=asyncio.FIRST_COMPLETED
+                    )
+                finally:
+                    moved.cancel()
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                # A slot was handed to us after all, pass it on
+                self._release()
+            else:
+                waiter.cancel()
+                self._remove(user, waiter)
+                self._queue_moved.set()
+                self._queue_moved = asyncio.Event()
+            raise
+
+    async def submit(
+        self,
+        user: Hashable,
+        func: Callable[..., Awaitable[Any]],
+        *args,
+        on_position: Optional[PositionCallback] = None,
+        timeout: Optional[float] = None,
+        group: Optional[Hashable] = None,
+    ) -> Any:
+        """
+        Await `func(*args)` once a slot is free for it and return its result.
+
+        `on_position` is awaited with the 1-based queue position whenever the job has to
+        wait. SchedulerQueueFull is raised if the queue, or `user`'s share of it, is full,
+        and asyncio.TimeoutError if the job ran for longer than `timeout` seconds. Queued
+        jobs of `user` with the same `group` count as one towards their share.
+        """
+        queued_at = perf_counter()
+        try:
+            await self._acquire(user, on_position, group)
+        except asyncio.CancelledError:
+            self.jobs_cancelled += 1
+            raise
+        started_at = perf_counter()
+
+        try:
+            return await asyncio.wait_for(func(*args), timeout)
+        except asyncio.TimeoutError:
+            self.jobs_timed_out += 1
+            logger.info(f"Job of {user} timed out after {timeout}s.")
+            raise
+        except asyncio.CancelledError:
+            self.jobs_cancelled += 1
+            raise
+        finally:
+            self._release()
+            timing = JobTiming(started_at - queued_at, perf_counter() - started_at)
+            self.timings.append(timing)
+            self.jobs_run += 1
+            logger.trace(
+                f"Job of {user} waited {timing.wait:.2f}s and ran {timing.run:.2f}s "
+                f"(queue depth {self.queue_depth})."
+            )